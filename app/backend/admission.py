@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import numpy as np
+from aiohttp import web
+
+from shared_store import SHARED_DATA_DIR
+
+logger = logging.getLogger("voicerag")
+
+# WebSocket close code 1013: "Try Again Later"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class _GlobalSessionCounter:
+    """Per-worker session counts in a small shared file, summed across live workers."""
+
+    def __init__(self, root: str = SHARED_DATA_DIR, slots: int = 64):
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, "sessions.bin")
+        self._lock_path = path + ".lock"
+        with open(self._lock_path, "a+b") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(path) or os.path.getsize(path) != slots * 16:
+                with open(path, "wb") as f:
+                    f.truncate(slots * 16)
+            # Columns: pid, active sessions
+            self._slots = np.memmap(path, dtype=np.int64, mode="r+", shape=(slots, 2))
+            self._slot = self._claim_slot()
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _claim_slot(self) -> int:
+        pid = os.getpid()
+        for i, (slot_pid, _) in enumerate(self._slots):
+            if slot_pid in (0, pid) or not _alive(int(slot_pid)):
+                self._slots[i] = (pid, 0)
+                return i
+        raise RuntimeError("No free session counter slot; increase the slot count")
+
+    def set(self, active: int):
+        self._slots[self._slot, 1] = active
+
+    def total(self) -> int:
+        return int(sum(count for pid, count in self._slots if pid and count and _alive(int(pid))))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionController:
+    """Admission control for realtime sessions.
+
+    Sessions are admitted while both the per-worker and the global (all workers)
+    caps allow it. Otherwise they wait in a short FIFO queue and are told so with an
+    `extension.admission.queued` event. When the queue is full or the wait times
+    out, the socket is closed with code 1013 and a retry hint. The effective caps
+    shrink when event-loop lag or the upstream 429 rate climbs and recover slowly
+    once they settle (additive increase, multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = int(os.getenv("MAX_SESSIONS_PER_WORKER", 50)),
+        max_global_sessions: int = int(os.getenv("MAX_SESSIONS_GLOBAL", 150)),
+        max_queue: int = int(os.getenv("ADMISSION_QUEUE_SIZE", 20)),
+        queue_timeout: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10)),
+        lag_threshold: float = 0.1,
+        throttle_threshold: float = 0.1,
+        min_factor: float = 0.25,
+        shared_data_dir: str = SHARED_DATA_DIR,
+    ):
+        self.max_sessions = max_sessions
+        self.max_global_sessions = max_global_sessions
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lag_threshold = lag_threshold
+        self.throttle_threshold = throttle_threshold
+        self.min_factor = min_factor
+        self._global = _GlobalSessionCounter(shared_data_dir)
+
+        self.active = 0
+        self.factor = 1.0
+        self.loop_lag = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._upstream: deque[tuple[float, bool]] = deque(maxlen=200)
+        self._monitor: Optional[asyncio.Task] = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    @property
+    def session_limit(self) -> int:
+        return max(1, int(self.max_sessions * self.factor))
+
+    @property
+    def global_session_limit(self) -> int:
+        return max(1, int(self.max_global_sessions * self.factor))
+
+    def upstream_throttle_rate(self, window: float = 60.0) -> float:
+        cutoff = time.monotonic() - window
+        recent = [throttled for at, throttled in self._upstream if at >= cutoff]
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def record_upstream(self, throttled: bool):
+        self._upstream.append((time.monotonic(), throttled))
+
+    def _has_capacity(self) -> bool:
+        return self.active < self.session_limit and self._global.total() < self.global_session_limit
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        self._global.set(self.active)
+
+    def _retry_after(self) -> float:
+        # Rough hint: a queue's worth of waiting, longer while we're shedding load
+        return round(self.queue_timeout / self.factor, 1)
+
+    async def _reject(self, ws: web.WebSocketResponse, reason: str):
+        self.rejected += 1
+        retry_after = self._retry_after()
+        logger.info("Rejecting realtime session (%s), retry after %.1fs", reason, retry_after)
+        with contextlib.suppress(ConnectionResetError):
+            await ws.send_json({
+                "type": "extension.admission.rejected",
+                "reason": reason,
+                "retry_after_ms": int(retry_after * 1000),
+            })
+        await ws.close(code=CLOSE_TRY_AGAIN_LATER, message=f"retry after {retry_after}s".encode())
+
+    async def acquire(self, ws: web.WebSocketResponse) -> bool:
+        """Admit the session, queue it, or reject it. Returns False if rejected (socket closed)."""
+        if not self._waiters and self._has_capacity():
+            self._admit()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            await self._reject(ws, "saturated")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await ws.send_json({
+                "type": "extension.admission.queued",
+                "position": len(self._waiters),
+                "max_wait_ms": int(self.queue_timeout * 1000),
+            })
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            await self._reject(ws, "queue_timeout")
+            return False
+        except (asyncio.CancelledError, ConnectionResetError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the client went away; hand the slot on
+                self.release()
+            else:
+                waiter.cancel()
+            if isinstance(e, ConnectionResetError):
+                return False
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.total_wait += time.monotonic() - started
+        # _wake() already counted this session as active
+        try:
+            await ws.send_json({"type": "extension.admission.admitted"})
+        except ConnectionResetError:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._global.set(self.active)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+
+    async def _monitor_loop(self, interval: float = 0.5):
+        lagging_since: Optional[float] = None
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - start - interval
+            self.loop_lag = 0.8 * self.loop_lag + 0.2 * max(lag, 0.0)
+
+            overloaded = self.loop_lag > self.lag_threshold or self.upstream_throttle_rate() > self.throttle_threshold
+            now = time.monotonic()
+            if overloaded:
+                # Back off at most every few seconds so one burst doesn't collapse the limit
+                if lagging_since is None or now - lagging_since > 5.0:
+                    self.factor = max(self.min_factor, self.factor * 0.8)
+                    lagging_since = now
+                    logger.warning("Shedding load: session limit factor %.2f (lag %.0fms, 429 rate %.2f)",
+                                   self.factor, self.loop_lag * 1000, self.upstream_throttle_rate())
+            else:
+                lagging_since = None
+                self.factor = min(1.0, self.factor + 0.01)
+                # Global capacity may also have been freed by another worker
+                self._wake()
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "active_global": self._global.total(),
+            "waiting": len(self._waiters),
+            "session_limit": self.session_limit,
+            "global_session_limit": self.global_session_limit,
+            "limit_factor": round(self.factor, 3),
+            "loop_lag_ms": round(self.loop_lag * 1000, 2),
+            "upstream_429_rate": round(self.upstream_throttle_rate(), 3),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(self.total_wait / self.queued * 1000, 1) if self.queued else 0.0,
+        }
+
+    async def _on_startup(self, app: web.Application):
+        self._monitor = asyncio.create_task(self._monitor_loop())
+
+    async def _on_cleanup(self, app: web.Application):
+        if self._monitor is not None:
+            self._monitor.cancel()
+        self._global.set(0)
+
+    def attach_to_app(self, app: web.Application):
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -7,15 +8,27 @@ from azure.core.credentials import AzureKeyCredential
 from azure.identity import AzureDeveloperCliCredential, DefaultAzureCredential
 from dotenv import load_dotenv
 
-from ragtools import attach_rag_tools
+from admission import AdmissionController
+from audio import TRIM_INPUT_SILENCE
+from embedders import EmbedderMismatchError, create_embedder
+from geo_clusters import GeoClusterApi
+from listings_api import ListingDetailsCache, ListingsApi
+from metrics import MetricsRegistry
+from ragtools import attach_rag_tools, warm_up_search_credentials
+from readiness import Readiness
+from realtime_router import parse_realtime_targets
 from rtmt import RTMiddleTier
 
 from search_manager import SearchManager
+from shared_store import SharedEmbeddingCache, SharedListingStore
+from static_files import StaticFiles
+from vector_compression import EMBEDDING_DIMENSIONS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("voicerag")
 
 async def create_app():
+    readiness = Readiness()
     if not os.environ.get("RUNNING_IN_PRODUCTION"):
         logger.info("Running in development mode, loading from .env file")
         load_dotenv()
@@ -39,10 +52,12 @@ async def create_app():
     rtmt = RTMiddleTier(
         credentials=llm_credential,
         endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-        deployment=os.environ["AZURE_OPENAI_REALTIME_DEPLOYMENT"]
+        deployment=os.environ["AZURE_OPENAI_REALTIME_DEPLOYMENT"],
+        targets=parse_realtime_targets(os.environ.get("AZURE_OPENAI_REALTIME_TARGETS"))
     )
     rtmt.temperature = 0.6
     rtmt.max_tokens = 1000
+    rtmt.trim_silence = TRIM_INPUT_SILENCE
     rtmt.system_message = """
     You are **Nicole**, an AI companion.
     Mission  
@@ -74,23 +89,66 @@ async def create_app():
 
     You are calm, warm, and solution-oriented. Your goal in every exchange is to leave the user feeling heard, empowered, and clear on their next constructive step.
     """
+    current_directory = Path(__file__).parent
+
+    # Listing data lives in memory-mapped snapshots shared by all gunicorn workers;
+    # whichever worker starts first publishes it, the rest just map it.
+    listing_store = SharedListingStore()
+    app["listing_store"] = listing_store
+
+    def publish_listings():
+        # Only needed when no snapshot exists yet, so keep the ingestion SDK imports out of boot
+        from ingest import iter_listings
+        data_file = current_directory / "data" / "flat_data.json"
+        data_stat = data_file.stat()
+        listing_store.publish_if_missing(
+            lambda: iter_listings(str(data_file)),
+            source=f"{data_file}:{data_stat.st_size}:{data_stat.st_mtime_ns}"
+        )
+
+    embedder = create_embedder(model="text-embedding-3-large", dimensions=EMBEDDING_DIMENSIONS)
     search_manager = SearchManager(
         service_name=os.getenv("AZURE_SEARCH_SERVICE_NAME"),
         api_key=os.getenv("AZURE_SEARCH_API_KEY"),
         index_name=os.getenv("AZURE_SEARCH_INDEX"),
-        embedding_model="text-embedding-3-large"
+        embedding_model="text-embedding-3-large",
+        embedder=embedder,
+        embedding_cache=SharedEmbeddingCache(dimensions=embedder.dimensions, namespace=embedder.name)
     )
 
-    attach_rag_tools(rtmt, credentials=search_credential, search_manager=search_manager)
+    listing_details = ListingDetailsCache()
+    attach_rag_tools(rtmt, credentials=search_credential, search_manager=search_manager,
+                     listing_store=listing_store, listing_details=listing_details)
+    ListingsApi(search_manager, listing_details).attach_to_app(app, "/api/listings")
+    geo_clusters = GeoClusterApi(listing_store)
+    geo_clusters.attach_to_app(app, "/api/listings/clusters")
+    rtmt.admission = AdmissionController()
+    rtmt.admission.attach_to_app(app)
     rtmt.attach_to_app(app, "/realtime")
 
+    metrics = MetricsRegistry()
+    metrics.register("realtime", lambda: rtmt.metrics)
+    metrics.register("admission", lambda: rtmt.admission.metrics)
+    metrics.register("realtime_routing", lambda: rtmt.router.metrics)
+    metrics.register("search_coalescing", lambda: search_manager.metrics)
+    metrics.register("listing_details_cache", lambda: listing_details.metrics)
+    metrics.register("geo_clusters", lambda: geo_clusters.metrics)
+    metrics.attach_to_app(app, "/metrics")
+
+    # Token fetches and client construction run after the worker starts accepting
+    # connections; /ready reports when they are all done.
+    readiness.add("realtime_token", rtmt.warm_up)
+    readiness.add("search_token", lambda: warm_up_search_credentials(search_credential))
+    readiness.add("embedder", search_manager.warm_up, permanent=(EmbedderMismatchError,))
+    readiness.add("listing_store", lambda: asyncio.to_thread(publish_listings))
+    readiness.attach_to_app(app, "/ready")
+
     async def health_check(request):
         return web.Response(text="OK", status=200)
 
-    current_directory = Path(__file__).parent
     app.add_routes([web.get('/health', health_check)])
-    app.add_routes([web.get('/', lambda _: web.FileResponse(current_directory / 'static/index.html'))])
-    app.router.add_static('/', path=current_directory / 'static', name='static')
+    # Keep this last, it serves every remaining GET path from the built frontend
+    StaticFiles(current_directory / 'static').attach_to_app(app)
     
     return app
 
@@ -0,0 +1,269 @@
+import argparse
+import os
+import time
+from typing import Any, Dict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The realtime API's pcm16 format: 16-bit little-endian mono at 24 kHz
+SAMPLE_RATE = 24000
+
+TRIM_INPUT_SILENCE = os.getenv("TRIM_INPUT_SILENCE", "false").lower() in ("true", "1", "yes")
+SILENCE_THRESHOLD_DBFS = float(os.getenv("SILENCE_THRESHOLD_DBFS", -45))
+
+# G.711 mu-law constants (reference 14-bit formulation, as in Sun's g711.c)
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+
+def _ulaw_encode_table() -> np.ndarray:
+    # Every int16 sample, indexed by its uint16 bit pattern
+    pcm = np.arange(65536, dtype=np.uint32).astype(np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)
+    # Magnitudes past the last segment clip to the loudest code
+    code = np.where(segment < 8, (segment << 4) | ((magnitude >> (segment + 1)) & 0xF), 0x7F)
+    return (code ^ mask).astype(np.uint8)
+
+
+def _ulaw_decode_table() -> np.ndarray:
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    magnitude = (((code & 0xF) << 3) + _ULAW_BIAS) << ((code & 0x70) >> 4)
+    return np.where(code & 0x80, _ULAW_BIAS - magnitude, magnitude - _ULAW_BIAS).astype("<i2")
+
+
+_ULAW_ENCODE = _ulaw_encode_table()
+_ULAW_DECODE = _ulaw_decode_table()
+
+
+def ulaw_to_pcm16(ulaw: bytes) -> bytes:
+    """Decode G.711 mu-law bytes to PCM16, e.g. for clients or checks in Python."""
+    return _ULAW_DECODE[np.frombuffer(ulaw, dtype=np.uint8)].tobytes()
+
+
+class SilenceTrimmer:
+    """Drops long stretches of silence from one session's inbound PCM16 audio.
+
+    Audio is cut into `frame_ms` frames and a frame is voiced when its RMS level is
+    above `threshold_dbfs`. Frames up to `hangover_ms` after the last voiced one are
+    kept, so the server still hears the trailing silence its turn detection waits
+    for; later ones are dropped. The last `padding_ms` of dropped audio is held
+    back and sent just before the next voiced frame, which keeps speech onsets and
+    the server's prefix padding intact.
+    """
+
+    def __init__(
+        self,
+        threshold_dbfs: float = SILENCE_THRESHOLD_DBFS,
+        hangover_ms: int = 800,
+        padding_ms: int = 300,
+        frame_ms: int = 10,
+        sample_rate: int = SAMPLE_RATE,
+    ):
+        self.threshold = 32768.0 * 10 ** (threshold_dbfs / 20)
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.sample_rate = sample_rate
+        self.hangover_frames = hangover_ms // frame_ms
+        self.padding_bytes = sample_rate * padding_ms // 1000 * 2
+        # Only pcm16 with server turn detection; with manual commits every byte is the client's call
+        self._pcm16 = True
+        self._server_vad = True
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        self.reset()
+
+    @property
+    def enabled(self) -> bool:
+        return self._pcm16 and self._server_vad
+
+    def reset(self):
+        # Start out silent, so leading silence is trimmed too
+        self._since_voice = self.hangover_frames + 1
+        self._partial = b""
+        self._preroll = bytearray()
+
+    def configure(self, session: Dict[str, Any]):
+        """Follow the audio format and turn detection settings of a session.update."""
+        if "input_audio_format" in session:
+            self._pcm16 = session["input_audio_format"] == "pcm16"
+        if "turn_detection" in session:
+            turn_detection = session["turn_detection"] or {}
+            self._server_vad = turn_detection.get("type") == "server_vad"
+            # Keep comfortably more trailing silence and pre-roll than the server needs
+            if turn_detection.get("silence_duration_ms"):
+                self.hangover_frames = max(self.hangover_frames, (turn_detection["silence_duration_ms"] + 300) // self.frame_ms)
+            if turn_detection.get("prefix_padding_ms"):
+                self.padding_bytes = max(self.padding_bytes, self.sample_rate * turn_detection["prefix_padding_ms"] // 1000 * 2)
+
+    def process(self, pcm: bytes) -> bytes:
+        """The part of a chunk that should go upstream, possibly empty.
+
+        A trailing partial frame is held until the next chunk completes it.
+        """
+        started = time.perf_counter()
+        self.bytes_in += len(pcm)
+        data = self._partial + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._partial = data[usable:]
+        if usable == 0:
+            return b""
+
+        frames = np.frombuffer(data, dtype="<i2", count=usable // 2).astype(np.float32).reshape(-1, self.frame_bytes // 2)
+        voiced = np.sqrt(np.mean(frames * frames, axis=1)) > self.threshold
+        # Frames since the last voiced one, continuing the count from the previous chunk
+        positions = np.arange(len(voiced))
+        last_voiced = np.maximum.accumulate(np.where(voiced, positions, -1))
+        since_voice = np.where(last_voiced >= 0, positions - last_voiced, positions + 1 + self._since_voice)
+        keep = since_voice <= self.hangover_frames
+        self._since_voice = int(since_voice[-1])
+
+        out = bytearray()
+        bounds = [0, *(np.flatnonzero(np.diff(keep)) + 1).tolist(), len(keep)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            run = data[start * self.frame_bytes:end * self.frame_bytes]
+            if keep[start]:
+                out += self._preroll
+                out += run
+                self._preroll.clear()
+            else:
+                self._preroll += run
+                del self._preroll[:max(len(self._preroll) - self.padding_bytes, 0)]
+        self.bytes_out += len(out)
+        self.cpu_seconds += time.perf_counter() - started
+        return bytes(out)
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(self.bytes_in - self.bytes_out - len(self._partial), 0)
+
+
+class DownstreamEncoder:
+    """Transcodes one session's response audio (PCM16 at 24 kHz) to the client's encoding.
+
+    `format` is "pcm16" or "g711_ulaw" and `sample_rate` 24000, 12000 or 8000.
+    Downsampling low-pass filters with a windowed-sinc FIR and keeps the filter
+    history and decimation phase across deltas, so chunk boundaries are seamless.
+    """
+
+    FORMATS = ("pcm16", "g711_ulaw")
+    SAMPLE_RATES = (24000, 12000, 8000)
+
+    def __init__(self, format: str = "pcm16", sample_rate: int = SAMPLE_RATE, taps_per_factor: int = 16):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unsupported client audio format '{format}', expected one of {', '.join(self.FORMATS)}")
+        if sample_rate not in self.SAMPLE_RATES:
+            raise ValueError(f"Unsupported client sample rate {sample_rate}, expected one of {self.SAMPLE_RATES}")
+        self.format = format
+        self.sample_rate = sample_rate
+        self.factor = SAMPLE_RATE // sample_rate
+        taps = taps_per_factor * self.factor + 1
+        # Cut off a little below the new Nyquist frequency
+        n = np.arange(taps) - (taps - 1) / 2
+        cutoff = 0.45 / self.factor
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(taps)
+        self._kernel = (kernel / kernel.sum()).astype(np.float32)
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._phase = 0
+        self._partial = b""
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    @property
+    def passthrough(self) -> bool:
+        return self.format == "pcm16" and self.factor == 1
+
+    def encode(self, pcm: bytes) -> bytes:
+        """The encoded audio of a delta, possibly empty; an odd trailing byte waits for the next delta."""
+        started = time.perf_counter()
+        self.bytes_in += len(pcm)
+        data = self._partial + pcm
+        usable = len(data) - len(data) % 2
+        self._partial = data[usable:]
+        if usable == 0:
+            return b""
+
+        samples = np.frombuffer(data, dtype="<i2", count=usable // 2)
+        if self.factor > 1:
+            signal = np.concatenate([self._history, samples.astype(np.float32)])
+            # One filter window per input sample; keep every factor-th, continuing the previous delta's phase
+            windows = sliding_window_view(signal, len(self._kernel))[self._phase::self.factor]
+            self._phase = (self._phase - len(samples)) % self.factor
+            self._history = signal[len(signal) - len(self._history):]
+            samples = np.clip(np.rint(windows @ self._kernel), -32768, 32767).astype("<i2")
+        if self.format == "g711_ulaw":
+            out = _ULAW_ENCODE[samples.view(np.uint16)].tobytes()
+        else:
+            out = samples.tobytes()
+        self.bytes_out += len(out)
+        self.cpu_seconds += time.perf_counter() - started
+        return out
+
+
+class AudioSavings:
+    """Bytes saved by the per-session audio stages, summed over finished sessions."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.bytes_in = 0
+        self.bytes_saved = 0
+        self.cpu_seconds = 0.0
+
+    def record(self, bytes_in: int, bytes_saved: int, cpu_seconds: float = 0.0):
+        self.sessions += 1
+        self.bytes_in += bytes_in
+        self.bytes_saved += bytes_saved
+        self.cpu_seconds += cpu_seconds
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.sessions,
+            "bytes_in": self.bytes_in,
+            "bytes_saved": self.bytes_saved,
+            "saved_ratio": round(self.bytes_saved / self.bytes_in, 4) if self.bytes_in else 0.0,
+            "bytes_saved_per_session": self.bytes_saved // self.sessions if self.sessions else 0,
+            "cpu_ms_per_session": round(1000 * self.cpu_seconds / self.sessions, 3) if self.sessions else 0.0,
+        }
+
+
+def _synthetic_speech(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    # Voiced harmonics with a wandering pitch and syllable-rate envelope, plus a little noise
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 20))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) ** 0.5
+    signal = 6000 * envelope * voice + 200 * rng.standard_normal(len(t))
+    return np.clip(signal, -32768, 32767).astype("<i2")
+
+
+def benchmark(seconds: float = 60.0, chunk_ms: int = 100):
+    """CPU cost and bandwidth of each downstream encoding for one session's worth of audio."""
+    pcm = _synthetic_speech(seconds, np.random.default_rng(0)).tobytes()
+    chunk = SAMPLE_RATE * chunk_ms // 1000 * 2
+    print(f"{seconds:.0f}s of 24 kHz PCM16 in {chunk_ms}ms deltas ({len(pcm)} bytes)")
+    print(f"{'encoding':<20} {'bytes':>10} {'of pcm16':>9} {'cpu ms':>8} {'us/delta':>9} {'realtime x':>11}")
+    for format, sample_rate in [("pcm16", 24000), ("pcm16", 12000), ("pcm16", 8000),
+                                ("g711_ulaw", 24000), ("g711_ulaw", 8000)]:
+        encoder = DownstreamEncoder(format, sample_rate)
+        deltas = 0
+        for start in range(0, len(pcm), chunk):
+            encoder.encode(pcm[start:start + chunk])
+            deltas += 1
+        print(f"{format + '@' + str(sample_rate):<20} {encoder.bytes_out:>10} {encoder.bytes_out / len(pcm):>9.2f} "
+              f"{1000 * encoder.cpu_seconds:>8.1f} {1e6 * encoder.cpu_seconds / deltas:>9.0f} "
+              f"{seconds / max(encoder.cpu_seconds, 1e-9):>11.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the downstream audio encodings clients can negotiate.")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Seconds of synthetic speech per session")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="Duration of each response.audio.delta")
+    args = parser.parse_args()
+    benchmark(args.seconds, args.chunk_ms)
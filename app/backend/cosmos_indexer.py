@@ -1,7 +1,16 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional
+
 from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+from azure.cosmos.exceptions import CosmosHttpResponseError
 from dotenv import load_dotenv
 import os
 
+logger = logging.getLogger("voicerag")
+
 # Load environment variables
 load_dotenv()
 
@@ -44,6 +53,279 @@ class CosmosFlatListingService:
         ))
         return items
 
+class RequestCharge:
+    """Accumulates the RU charge reported by Cosmos DB response headers."""
+    total: float
+    requests: int
+    session_token: Optional[str]
+
+    def __init__(self):
+        self.total = 0.0
+        self.requests = 0
+        self.session_token = None
+
+    def __call__(self, headers: Dict[str, str], result: Any):
+        # query_items() invokes the hook once up-front with the pager itself; only
+        # the per-page invocations carry headers that belong to this operation.
+        if not isinstance(result, (dict, list)):
+            return
+        self.total += float(headers.get("x-ms-request-charge", 0.0))
+        self.requests += 1
+        self.session_token = headers.get("x-ms-session-token", self.session_token)
+
+
+class ListingPage:
+    items: List[Dict[str, Any]]
+    continuation_token: Optional[str]
+    request_charge: float
+
+    def __init__(self, items: List[Dict[str, Any]], continuation_token: Optional[str], request_charge: float):
+        self.items = items
+        self.continuation_token = continuation_token
+        self.request_charge = request_charge
+
+
+class BulkUpsertResult:
+    succeeded: int
+    failed: List[tuple[Dict[str, Any], Exception]]
+    request_charge: float
+    elapsed: float
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = []
+        self.request_charge = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _RequestUnitBudget:
+    """Token bucket over request units so bulk writes stay under the provisioned RU/s.
+
+    The cost of the next request is not known up-front, so callers reserve the running
+    average charge and settle the difference once the real charge is reported.
+    """
+
+    def __init__(self, ru_per_second: float, initial_estimate: float = 10.0):
+        self.ru_per_second = ru_per_second
+        self.estimate = initial_estimate
+        self._available = ru_per_second
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.ru_per_second, self._available + (now - self._updated) * self.ru_per_second)
+        self._updated = now
+
+    async def reserve(self) -> float:
+        async with self._lock:
+            cost = self.estimate
+            self._refill()
+            while self._available < cost:
+                await asyncio.sleep((cost - self._available) / self.ru_per_second)
+                self._refill()
+            self._available -= cost
+            return cost
+
+    def settle(self, reserved: float, actual: float):
+        self._available -= actual - reserved
+        # Exponential moving average of the observed per-request charge
+        self.estimate = 0.8 * self.estimate + 0.2 * actual
+
+    def throttled(self, retry_after: float):
+        # The service disagrees with our bookkeeping; drain the bucket for the retry-after window
+        self._available = min(self._available, -retry_after * self.ru_per_second)
+
+
+class AsyncCosmosFlatListingService:
+    """Non-blocking variant of CosmosFlatListingService built on azure.cosmos.aio.
+
+    Use as an async context manager (or call initialize()/close()) from the aiohttp app.
+    """
+
+    def __init__(
+        self,
+        endpoint=None,
+        key=None,
+        database_name=None,
+        container_name=None,
+        max_concurrency: int = 32,
+        ru_per_second: Optional[float] = None,
+    ):
+        self.endpoint = endpoint or os.getenv('COSMOS_ENDPOINT')
+        self.key = key or os.getenv('COSMOS_KEY')
+        self.database_name = database_name or os.getenv('DATABASE_NAME')
+        self.container_name = container_name or os.getenv('CONTAINER_NAME')
+
+        if not all([self.endpoint, self.key, self.database_name, self.container_name]):
+            raise ValueError("Missing required Cosmos DB configuration. Please check environment variables.")
+
+        self.max_concurrency = max_concurrency
+        # Optional RU/s budget for bulk writes, e.g. the container's provisioned throughput
+        ru_per_second = ru_per_second or float(os.getenv('COSMOS_BULK_RU_PER_SECOND', 0)) or None
+        self._ru_budget = _RequestUnitBudget(ru_per_second) if ru_per_second else None
+
+        self.client = AsyncCosmosClient(self.endpoint, credential=self.key)
+        self.database = None
+        self.container = None
+
+    async def initialize(self):
+        self.database = await self.client.create_database_if_not_exists(id=self.database_name)
+        self.container = await self.database.create_container_if_not_exists(
+            id=self.container_name,
+            partition_key=PartitionKey(path="/location")
+        )
+
+    async def close(self):
+        await self.client.close()
+
+    async def __aenter__(self):
+        await self.initialize()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def save_flat_listing(self, listing_data: Dict[str, Any]) -> tuple[Dict[str, Any], float]:
+        charge = RequestCharge()
+        response = await self.container.upsert_item(body=listing_data, response_hook=charge)
+        logger.debug("Upserted listing %s (%.2f RU)", listing_data.get("id"), charge.total)
+        return response, charge.total
+
+    async def _upsert_with_budget(self, listing: Dict[str, Any], max_throttle_retries: int = 5) -> float:
+        if self._ru_budget is None:
+            _, charge = await self.save_flat_listing(listing)
+            return charge
+        for attempt in range(max_throttle_retries + 1):
+            reserved = await self._ru_budget.reserve()
+            try:
+                _, charge = await self.save_flat_listing(listing)
+            except CosmosHttpResponseError as e:
+                if e.status_code != 429 or attempt == max_throttle_retries:
+                    self._ru_budget.settle(reserved, 0.0)
+                    raise
+                retry_after = float(e.headers.get("x-ms-retry-after-ms", 1000)) / 1000
+                self._ru_budget.settle(reserved, 0.0)
+                self._ru_budget.throttled(retry_after)
+                logger.info("Throttled by Cosmos DB, backing off for %.2fs", retry_after)
+                continue
+            self._ru_budget.settle(reserved, charge)
+            return charge
+
+    async def bulk_upsert(
+        self,
+        listings: Iterable[Dict[str, Any]] | AsyncIterable[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> BulkUpsertResult:
+        """Upsert many listings concurrently; failures are collected instead of aborting the batch."""
+        result = BulkUpsertResult()
+        start = time.perf_counter()
+
+        if isinstance(listings, AsyncIterable):
+            source = listings.__aiter__()
+        else:
+            source = _aiter_sync(listings)
+        source_lock = asyncio.Lock()
+
+        # A fixed pool of workers pulls from the source, so memory stays bounded no
+        # matter how many listings are passed in.
+        async def worker():
+            while True:
+                async with source_lock:
+                    try:
+                        listing = await source.__anext__()
+                    except StopAsyncIteration:
+                        return
+                try:
+                    charge = await self._upsert_with_budget(listing)
+                    result.request_charge += charge
+                    result.succeeded += 1
+                except Exception as e:
+                    logger.warning("Failed to upsert listing %s: %s", listing.get("id"), e)
+                    result.failed.append((listing, e))
+
+        await asyncio.gather(*(worker() for _ in range(max_concurrency or self.max_concurrency)))
+
+        result.elapsed = time.perf_counter() - start
+        logger.info(
+            "Bulk upsert: %d succeeded, %d failed, %.1f RU in %.2fs (%.0f items/s)",
+            result.succeeded, len(result.failed), result.request_charge, result.elapsed, result.items_per_second
+        )
+        return result
+
+    async def query_flat_listing_pages(
+        self,
+        location: str,
+        max_item_count: int = 100,
+        continuation_token: Optional[str] = None,
+    ) -> AsyncIterator[ListingPage]:
+        """Yield listings for a location page by page.
+
+        Each page carries the continuation token for resuming after it, so callers can
+        hand the token to a client and pick up the query later.
+        """
+        charge = RequestCharge()
+        pager = self.container.query_items(
+            query="SELECT * FROM c WHERE c.location = @location",
+            parameters=[{"name": "@location", "value": location}],
+            partition_key=location,
+            max_item_count=max_item_count,
+            response_hook=charge,
+        ).by_page(continuation_token)
+
+        charge_before = 0.0
+        async for page in pager:
+            items = [item async for item in page]
+            yield ListingPage(items, pager.continuation_token, charge.total - charge_before)
+            charge_before = charge.total
+
+    async def read_flat_listings(self, location: str) -> tuple[List[Dict[str, Any]], RequestCharge]:
+        """Read a whole partition, returning the RU charge and session token alongside the items."""
+        charge = RequestCharge()
+        items = [item async for item in self.container.query_items(
+            query="SELECT * FROM c WHERE c.location = @location",
+            parameters=[{"name": "@location", "value": location}],
+            partition_key=location,
+            response_hook=charge,
+        )]
+        return items, charge
+
+    async def partition_version(self, location: str, session_token: Optional[str] = None) -> tuple[tuple[int, int], float]:
+        """Cheap fingerprint of a partition: (item count, newest _ts) and the RU it cost.
+
+        Any upsert bumps _ts and any delete changes the count, so an unchanged
+        fingerprint means a previously read copy of the partition is still valid.
+        """
+        charge = RequestCharge()
+        kwargs = {"session_token": session_token} if session_token else {}
+        rows = [row async for row in self.container.query_items(
+            query="SELECT COUNT(1) AS n, MAX(c._ts) AS ts FROM c WHERE c.location = @location",
+            parameters=[{"name": "@location", "value": location}],
+            partition_key=location,
+            response_hook=charge,
+            **kwargs,
+        )]
+        row = rows[0] if rows else {}
+        return (row.get("n", 0), row.get("ts", 0)), charge.total
+
+    async def query_flat_listings(self, location: str, max_item_count: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        total_charge = 0.0
+        async for page in self.query_flat_listing_pages(location, max_item_count=max_item_count):
+            total_charge += page.request_charge
+            for item in page.items:
+                yield item
+        logger.debug("Queried listings in %s (%.2f RU)", location, total_charge)
+
+
+async def _aiter_sync(items: Iterable[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
 # Example usage
 if __name__ == "__main__":
     # Sample data
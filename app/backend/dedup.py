@@ -0,0 +1,129 @@
+import argparse
+import json
+import re
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SHINGLE_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+
+class NearDuplicateDetector:
+    """Streaming near-duplicate detection for listings with MinHash and LSH.
+
+    Title and description are shingled into word 3-grams and summarised by a
+    `num_perm` MinHash signature. Signatures are split into `bands` LSH bands; the
+    band keys also include the exact price, size and (rounded) coordinates, so only
+    listings that agree on those can collide. A listing whose estimated Jaccard
+    similarity with a colliding canonical listing reaches `threshold` is a duplicate
+    of it; otherwise it becomes a new canonical listing. One pass, first seen wins,
+    and only canonical signatures are kept in memory.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 8, threshold: float = 0.8, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash family; odd multipliers, wrap-around uint64 arithmetic
+        self._a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._buckets: Dict[int, int] = {}
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self.canonical_ids: List[str] = []
+        # canonical id -> ids of the duplicates dropped in its favour
+        self.clusters: Dict[str, List[str]] = {}
+        self.duplicates = 0
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = np.array([zlib.crc32(w.encode("utf-8")) for w in _WORD.findall(text.lower())], dtype=np.uint64)
+        if len(words) < 3:
+            return words
+        return (words[:-2] * _SHINGLE_MULTIPLIERS[0]) ^ (words[1:-1] * _SHINGLE_MULTIPLIERS[1]) ^ (words[2:] * _SHINGLE_MULTIPLIERS[2])
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        shingles = self._shingles(text)
+        if len(shingles) == 0:
+            return None
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    @staticmethod
+    def _attributes(listing: Dict[str, Any]) -> tuple:
+        def rounded(value: Any, digits: int) -> Any:
+            try:
+                return round(float(value), digits)
+            except (TypeError, ValueError):
+                return value
+
+        # ~1m at 5 decimals, so re-geocoded copies of the same address still match
+        return (rounded(listing.get("price"), 2), rounded(listing.get("size"), 1),
+                rounded(listing.get("lat"), 5), rounded(listing.get("lng"), 5))
+
+    def check(self, listing: Dict[str, Any]) -> Optional[str]:
+        """Register a listing; returns the canonical id if it is a near-duplicate, else None."""
+        text = f"{listing.get('title') or ''} {listing.get('description') or ''}"
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        bands = signature.reshape(self.bands, self.rows)
+        attributes = self._attributes(listing)
+        keys = [hash((band, bands[band].tobytes(), attributes)) for band in range(self.bands)]
+
+        for key in keys:
+            row = self._buckets.get(key)
+            if row is not None and np.mean(self._signatures[row] == signature) >= self.threshold:
+                canonical = self.canonical_ids[row]
+                self.clusters.setdefault(canonical, []).append(str(listing.get("id")))
+                self.duplicates += 1
+                return canonical
+
+        row = len(self.canonical_ids)
+        if row == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[row] = signature
+        self.canonical_ids.append(str(listing.get("id")))
+        for key in keys:
+            self._buckets.setdefault(key, row)
+        return None
+
+    def unique(self, listings: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """The listings that are not near-duplicates of an earlier one."""
+        for listing in listings:
+            if self.check(listing) is None:
+                yield listing
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "canonical": len(self.canonical_ids),
+            "duplicates": self.duplicates,
+            "clusters": len(self.clusters),
+            "largest_cluster": 1 + max((len(d) for d in self.clusters.values()), default=0),
+        }
+
+
+if __name__ == "__main__":
+    import time
+
+    from ingest import iter_listings
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate listing clusters in a listings file.")
+    parser.add_argument("path", help="NDJSON or JSON array file of listings")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--report", help="Write {canonical id: [duplicate ids]} as JSON here")
+    args = parser.parse_args()
+
+    detector = NearDuplicateDetector(threshold=args.threshold)
+    started = time.perf_counter()
+    count = sum(1 for _ in detector.unique(iter_listings(args.path)))
+    elapsed = time.perf_counter() - started
+    print(f"{count} unique listings, {detector.stats} in {elapsed:.1f}s")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(detector.clusters, f, indent=1)
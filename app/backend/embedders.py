@@ -0,0 +1,205 @@
+import abc
+import hashlib
+import os
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from vector_compression import EMBEDDING_DIMENSIONS
+
+EMBEDDER = os.getenv("EMBEDDER", "azure")
+ONNX_EMBEDDING_MODEL_DIR = os.getenv("ONNX_EMBEDDING_MODEL_DIR")
+
+# Prefix of the vector search profile that records the embedder in the index definition
+EMBEDDER_PROFILE_PREFIX = "embedder-"
+
+
+class EmbedderMismatchError(ValueError):
+    pass
+
+
+class Embedder(abc.ABC):
+    """Turns texts into vectors. Subclasses implement embed() for a batch of texts."""
+
+    name: str
+    dimensions: int
+    # Whether the search service can vectorize queries itself (integrated vectorization)
+    service_vectorizable: bool = False
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    def warm_up(self):
+        """Load clients or models ahead of the first request."""
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+    @property
+    def profile_name(self) -> str:
+        """Vector profile name identifying this embedder and its dimensions in an index."""
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", self.name).strip("-").lower()
+        return f"{EMBEDDER_PROFILE_PREFIX}{slug}-{self.dimensions}"[:128]
+
+
+class AzureOpenAIEmbedder(Embedder):
+    service_vectorizable = True
+
+    def __init__(self, model: str, dimensions: int = EMBEDDING_DIMENSIONS, max_batch_size: int = 256):
+        self.model = model
+        self.name = f"azure-{model}"
+        self.dimensions = dimensions
+        self.max_batch_size = max_batch_size
+        self._client = None
+
+    @property
+    def client(self):
+        # Importing and constructing the OpenAI client is slow; defer it to first use
+        if self._client is None:
+            from openai import AzureOpenAI
+            self._client = AzureOpenAI(
+                api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                api_key=os.getenv("AZURE_OPENAI_API_KEY")
+            )
+        return self._client
+
+    def warm_up(self):
+        self.client
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.max_batch_size):
+            # One request per batch; results come back in input order
+            response = self.client.embeddings.create(
+                input=texts[start:start + self.max_batch_size], model=self.model, dimensions=self.dimensions
+            )
+            embeddings.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+        return embeddings
+
+
+class OnnxEmbedder(Embedder):
+    """Local CPU sentence embeddings from an exported ONNX model (e.g. all-MiniLM-L6-v2).
+
+    model_dir must contain model.onnx and the Hugging Face tokenizer.json. Token
+    embeddings are mean-pooled over the attention mask and L2-normalised.
+    Requires the optional onnxruntime and tokenizers packages.
+    """
+
+    def __init__(self, model_dir: str, dimensions: int, max_length: int = 256, max_batch_size: int = 32):
+        self.model_dir = model_dir
+        self.name = f"onnx-{os.path.basename(os.path.normpath(model_dir))}"
+        self.dimensions = dimensions
+        self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime
+                from tokenizers import Tokenizer
+            except ImportError as e:
+                raise ImportError("The onnx embedder needs `pip install onnxruntime tokenizers`") from e
+            tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(self.max_length)
+            tokenizer.enable_padding()
+            self._tokenizer = tokenizer
+            self._session = onnxruntime.InferenceSession(
+                os.path.join(self.model_dir, "model.onnx"), providers=["CPUExecutionProvider"]
+            )
+            self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def warm_up(self):
+        self._load()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self._load()
+        embeddings = []
+        for start in range(0, len(texts), self.max_batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + self.max_batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            tokens = self._session.run(None, {k: v for k, v in inputs.items() if k in self._input_names})[0]
+            mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if pooled.shape[1] != self.dimensions:
+                raise EmbedderMismatchError(
+                    f"ONNX model produces {pooled.shape[1]}-dimensional vectors, configured for {self.dimensions}"
+                )
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic feature-hashing embedder: no model, no network.
+
+    Word unigrams and bigrams are hashed into signed buckets and the result is
+    L2-normalised, so texts sharing words get similar vectors. Meant for tests,
+    local development and benchmarks, not for search quality.
+    """
+
+    _TOKEN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.name = "hashing"
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        words = self._TOKEN.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                matrix[row, digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix.tolist()
+
+
+def create_embedder(
+    kind: str = EMBEDDER,
+    model: str = "text-embedding-3-large",
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    model_dir: Optional[str] = ONNX_EMBEDDING_MODEL_DIR,
+) -> Embedder:
+    """Embedder for EMBEDDER=azure | onnx | hashing."""
+    if kind == "azure":
+        return AzureOpenAIEmbedder(model, dimensions)
+    if kind == "onnx":
+        if not model_dir:
+            raise ValueError("EMBEDDER=onnx requires ONNX_EMBEDDING_MODEL_DIR")
+        return OnnxEmbedder(model_dir, dimensions)
+    if kind == "hashing":
+        return HashingEmbedder(dimensions)
+    raise ValueError(f"Unknown embedder '{kind}', expected azure, onnx or hashing")
+
+
+def check_index_embedder(index, embedder: Embedder, vector_field: str = "embedding"):
+    """Raise EmbedderMismatchError if an existing index was built with another embedder or size."""
+    field = next((f for f in index.fields if f.name == vector_field), None)
+    if field is not None and field.vector_search_dimensions != embedder.dimensions:
+        raise EmbedderMismatchError(
+            f"Index '{index.name}' stores {field.vector_search_dimensions}-dimensional vectors, "
+            f"but the {embedder.name} embedder produces {embedder.dimensions}"
+        )
+    profiles = index.vector_search.profiles if index.vector_search and index.vector_search.profiles else []
+    recorded = [p.name for p in profiles if p.name.startswith(EMBEDDER_PROFILE_PREFIX)]
+    # Indexes created before embedders were recorded only have their dimensions checked
+    if recorded and embedder.profile_name not in recorded:
+        raise EmbedderMismatchError(
+            f"Index '{index.name}' was built with {recorded[0]}, but the configured embedder is {embedder.profile_name}"
+        )
@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from search_manager import SearchManager, preferences_filter
+from shared_store import SharedListingStore
+
+logger = logging.getLogger("voicerag")
+
+PRICE_INTERVAL = int(os.getenv("FACET_PRICE_INTERVAL", 250))
+SIZE_INTERVAL = int(os.getenv("FACET_SIZE_INTERVAL", 10))
+
+
+def _histogram(buckets: list, interval: int) -> list:
+    return [
+        {"from": bucket["value"], "to": bucket["value"] + interval, "count": bucket["count"]}
+        for bucket in sorted(buckets, key=lambda b: b["value"]) if bucket["count"]
+    ]
+
+
+class FacetCache:
+    """Listing counts and histograms per filter combination, computed with search facets.
+
+    Results are only fetched from the index (top=0, so no documents are returned)
+    on a miss. Entries are dropped when the index is rebuilt: the cache tracks a
+    generation made of the shared listing snapshot version, the index behind the
+    alias and its document count, re-checked at most every `generation_interval` seconds, plus a TTL as a
+    backstop for in-place updates that change neither.
+    """
+
+    def __init__(
+        self,
+        search_manager: SearchManager,
+        listing_store: Optional[SharedListingStore] = None,
+        ttl: float = 600.0,
+        capacity: int = 512,
+        generation_interval: float = 30.0,
+    ):
+        self.search_manager = search_manager
+        self.listing_store = listing_store
+        self.ttl = ttl
+        self.capacity = capacity
+        self.generation_interval = generation_interval
+        self.generation: Optional[str] = None
+        self._generation_checked = 0.0
+        self._entries: OrderedDict[str, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _check_generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked < self.generation_interval:
+            return
+        self._generation_checked = now
+        version = self.listing_store.current_version() if self.listing_store is not None else None
+        try:
+            index = await self.search_manager.current_index()
+            count = await self.search_manager.search_client.get_document_count()
+        except Exception as e:
+            logger.warning("Could not check the index generation: %s", e)
+            return
+        generation = f"{version}:{index}:{count}"
+        if self.generation is not None and generation != self.generation:
+            logger.info("Index changed (%s -> %s), dropping %d cached facet results",
+                        self.generation, generation, len(self._entries))
+            self._entries.clear()
+            self.invalidations += 1
+        self.generation = generation
+
+    def invalidate(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    async def count(self, preferences: Dict[str, Any]) -> Dict[str, Any]:
+        await self._check_generation()
+        filter_str = preferences_filter(preferences)
+        key = filter_str or ""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        total, facets = await self.search_manager.facet_counts(filter_str, [
+            f"price,interval:{PRICE_INTERVAL}",
+            f"size,interval:{SIZE_INTERVAL}",
+            "rooms,count:20",
+            "location,count:30",
+        ])
+        result = {
+            "count": total,
+            "price_histogram": _histogram(facets.get("price", []), PRICE_INTERVAL),
+            "size_histogram": _histogram(facets.get("size", []), SIZE_INTERVAL),
+            "rooms": {str(b["value"]): b["count"] for b in sorted(facets.get("rooms", []), key=lambda b: b["value"])},
+            "locations": {b["value"]: b["count"] for b in facets.get("location", [])},
+        }
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return result
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
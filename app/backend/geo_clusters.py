@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from shared_store import ListingSnapshot, SharedListingStore
+
+logger = logging.getLogger("voicerag")
+
+MAX_ZOOM = int(os.getenv("GEO_CLUSTER_MAX_ZOOM", 18))
+# Cells per tile side is 2**CELL_BITS, i.e. 32px cells on 256px map tiles
+CELL_BITS = 3
+MAX_TILES_PER_REQUEST = 256
+_MAX_LATITUDE = 85.05112878
+
+
+def _cells(lat: np.ndarray, lng: np.ndarray, level: int) -> tuple[np.ndarray, np.ndarray]:
+    """Web Mercator grid coordinates of points on a 2**level x 2**level grid."""
+    scale = 2 ** level
+    x = (lng + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(np.clip(lat, -_MAX_LATITUDE, _MAX_LATITUDE)))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    cx = np.clip(np.floor(x * scale), 0, scale - 1).astype(np.int64)
+    cy = np.clip(np.floor(y * scale), 0, scale - 1).astype(np.int64)
+    return cx, cy
+
+
+class _Cluster:
+    count: int
+    lat_sum: float
+    lng_sum: float
+    price_min: Optional[float]
+    price_max: Optional[float]
+    listing_id: Optional[str]
+
+    def __init__(self):
+        self.count = 0
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+        self.price_min = None
+        self.price_max = None
+        self.listing_id = None
+
+    def add(self, lat: float, lng: float, price: Optional[float], listing_id: Optional[str], count: int = 1):
+        self.count += count
+        self.lat_sum += lat
+        self.lng_sum += lng
+        if price is not None:
+            self.price_min = price if self.price_min is None else min(self.price_min, price)
+            self.price_max = price if self.price_max is None else max(self.price_max, price)
+        self.listing_id = listing_id if self.count == 1 else None
+
+    def merge(self, other: "_Cluster"):
+        self.add(other.lat_sum, other.lng_sum, other.price_min, other.listing_id, other.count)
+        if other.price_max is not None:
+            self.price_max = max(self.price_max, other.price_max)
+
+    def to_json(self) -> Dict[str, Any]:
+        cluster = {
+            "lat": round(self.lat_sum / self.count, 6),
+            "lng": round(self.lng_sum / self.count, 6),
+            "count": self.count,
+            "price_min": self.price_min,
+            "price_max": self.price_max,
+        }
+        if self.listing_id is not None:
+            cluster["id"] = self.listing_id
+        return cluster
+
+
+class GeoClusterIndex:
+    """Hierarchical grid clusters of listings for zoom levels 0..max_zoom.
+
+    Level z holds one cluster per occupied 2**(z+CELL_BITS) grid cell, keyed by map
+    tile, so a zoom-z tile contains at most 2**CELL_BITS squared clusters. Cells form
+    a quadtree: only the leaf level is computed from listings, every coarser level is
+    rolled up from its four children. update() diffs the new listings against the
+    previous ones and recomputes just the cells, and their ancestors, that changed.
+    """
+
+    def __init__(self, max_zoom: int = MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self._points: Dict[str, tuple[float, float, Optional[float]]] = {}
+        self._leaf_of: Dict[str, tuple[int, int]] = {}
+        self._members: Dict[tuple[int, int], set[str]] = {}
+        # zoom -> tile -> cell -> cluster
+        self._levels: List[Dict[tuple[int, int], Dict[tuple[int, int], _Cluster]]] = [
+            {} for _ in range(max_zoom + 1)
+        ]
+
+    def tile(self, zoom: int, tx: int, ty: int) -> Iterable[_Cluster]:
+        return self._levels[zoom].get((tx, ty), {}).values()
+
+    def update(self, ids: List[str], lat: np.ndarray, lng: np.ndarray, price: np.ndarray) -> Dict[int, set]:
+        """Replace the indexed listings; returns the affected tiles per zoom."""
+        valid = np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) <= 90) & (np.abs(lng) <= 180)
+        points = {
+            ids[i]: (float(lat[i]), float(lng[i]), None if np.isnan(price[i]) else float(price[i]))
+            for i in np.flatnonzero(valid)
+        }
+        changed = [i for i in points.keys() | self._points.keys() if points.get(i) != self._points.get(i)]
+        if not changed:
+            return {}
+
+        dirty: set[tuple[int, int]] = set()
+        for listing_id in changed:
+            if listing_id in self._leaf_of:
+                leaf = self._leaf_of.pop(listing_id)
+                self._members[leaf].discard(listing_id)
+                dirty.add(leaf)
+        added = [i for i in changed if i in points]
+        if added:
+            cx, cy = _cells(
+                np.array([points[i][0] for i in added]), np.array([points[i][1] for i in added]),
+                self.max_zoom + CELL_BITS,
+            )
+            for listing_id, leaf in zip(added, zip(cx.tolist(), cy.tolist())):
+                self._leaf_of[listing_id] = leaf
+                self._members.setdefault(leaf, set()).add(listing_id)
+                dirty.add(leaf)
+        self._points = points
+
+        affected_tiles: Dict[int, set] = {}
+        for zoom in range(self.max_zoom, -1, -1):
+            tiles = self._levels[zoom]
+            for cell in dirty:
+                tile_key = (cell[0] >> CELL_BITS, cell[1] >> CELL_BITS)
+                cluster = self._leaf_cluster(cell) if zoom == self.max_zoom else self._rolled_up_cluster(zoom, cell)
+                tile = tiles.setdefault(tile_key, {})
+                if cluster is None:
+                    tile.pop(cell, None)
+                    if not tile:
+                        del tiles[tile_key]
+                else:
+                    tile[cell] = cluster
+                affected_tiles.setdefault(zoom, set()).add(tile_key)
+            dirty = {(cx >> 1, cy >> 1) for cx, cy in dirty}
+        return affected_tiles
+
+    def _leaf_cluster(self, cell: tuple[int, int]) -> Optional[_Cluster]:
+        members = self._members.get(cell)
+        if not members:
+            self._members.pop(cell, None)
+            return None
+        cluster = _Cluster()
+        for listing_id in members:
+            lat, lng, price = self._points[listing_id]
+            cluster.add(lat, lng, price, listing_id)
+        return cluster
+
+    def _rolled_up_cluster(self, zoom: int, cell: tuple[int, int]) -> Optional[_Cluster]:
+        children = self._levels[zoom + 1]
+        cluster = None
+        for dx in (0, 1):
+            for dy in (0, 1):
+                child_cell = (cell[0] * 2 + dx, cell[1] * 2 + dy)
+                child = children.get((child_cell[0] >> CELL_BITS, child_cell[1] >> CELL_BITS), {}).get(child_cell)
+                if child is not None:
+                    cluster = cluster or _Cluster()
+                    cluster.merge(child)
+        return cluster
+
+
+class GeoClusterApi:
+    """GET /api/listings/clusters?bbox=west,south,east,north&zoom=z
+
+    Returns the precomputed clusters of every map tile overlapping the bounding box.
+    The index follows the shared listing snapshot and is updated incrementally when a
+    new version is published; serialized tiles are cached and only the tiles touched
+    by an update are evicted.
+    """
+
+    def __init__(self, listing_store: SharedListingStore, max_zoom: int = MAX_ZOOM, tile_cache_size: int = 4096):
+        self.listing_store = listing_store
+        self.index = GeoClusterIndex(max_zoom)
+        self.version: Optional[str] = None
+        self.tile_cache_size = tile_cache_size
+        self._tile_cache: OrderedDict[tuple[int, int, int], List[Dict[str, Any]]] = OrderedDict()
+        self._refresh_lock = asyncio.Lock()
+        self.updates = 0
+        self.last_update_seconds = 0.0
+        self.tile_hits = 0
+        self.tile_misses = 0
+
+    def _update_from(self, snapshot: ListingSnapshot):
+        started = time.perf_counter()
+        ids = [snapshot.text("id", row) for row in range(len(snapshot))]
+
+        def column(name: str) -> np.ndarray:
+            if name in snapshot.columns:
+                return np.asarray(snapshot.columns[name], dtype=np.float64)
+            return np.full(len(snapshot), np.nan)
+
+        affected = self.index.update(ids, column("lat"), column("lng"), column("price"))
+        for zoom, tiles in affected.items():
+            for tx, ty in tiles:
+                self._tile_cache.pop((zoom, tx, ty), None)
+        self.version = snapshot.version
+        self.updates += 1
+        self.last_update_seconds = time.perf_counter() - started
+        logger.info("Geo clusters updated to %s in %.3fs (%d tiles affected)",
+                    snapshot.version, self.last_update_seconds, sum(len(t) for t in affected.values()))
+
+    async def refresh(self):
+        if self.listing_store.current_version() == self.version:
+            return
+        async with self._refresh_lock:
+            snapshot = self.listing_store.snapshot()
+            if snapshot is not None and snapshot.version != self.version:
+                await asyncio.to_thread(self._update_from, snapshot)
+
+    def _tile(self, zoom: int, tx: int, ty: int) -> List[Dict[str, Any]]:
+        key = (zoom, tx, ty)
+        clusters = self._tile_cache.get(key)
+        if clusters is not None:
+            self.tile_hits += 1
+            self._tile_cache.move_to_end(key)
+            return clusters
+        self.tile_misses += 1
+        clusters = [cluster.to_json() for cluster in self.index.tile(zoom, tx, ty)]
+        self._tile_cache[key] = clusters
+        while len(self._tile_cache) > self.tile_cache_size:
+            self._tile_cache.popitem(last=False)
+        return clusters
+
+    async def _clusters_handler(self, request: web.Request) -> web.Response:
+        try:
+            west, south, east, north = (float(v) for v in request.query["bbox"].split(","))
+            zoom = int(request.query["zoom"])
+        except (KeyError, ValueError):
+            raise web.HTTPBadRequest(text="Expected bbox=west,south,east,north and an integer zoom")
+        if west > east or south > north or zoom < 0:
+            raise web.HTTPBadRequest(text="Invalid bbox or zoom")
+        zoom = min(zoom, self.index.max_zoom)
+
+        (tx_min, tx_max), (ty_max, ty_min) = (
+            _cells(np.array([south, north]), np.array([west, east]), zoom)
+        )
+        if (tx_max - tx_min + 1) * (ty_max - ty_min + 1) > MAX_TILES_PER_REQUEST:
+            raise web.HTTPBadRequest(text="Bounding box covers too many tiles for this zoom")
+
+        await self.refresh()
+        clusters = []
+        for tx in range(int(tx_min), int(tx_max) + 1):
+            for ty in range(int(ty_min), int(ty_max) + 1):
+                clusters.extend(self._tile(zoom, tx, ty))
+        body = {"version": self.version, "zoom": zoom, "clusters": clusters}
+        return web.Response(
+            text=json.dumps(body), content_type="application/json", headers={"Cache-Control": "public, max-age=60"}
+        )
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "listings": len(self.index._points),
+            "updates": self.updates,
+            "last_update_ms": round(self.last_update_seconds * 1000, 1),
+            "cached_tiles": len(self._tile_cache),
+            "tile_hits": self.tile_hits,
+            "tile_misses": self.tile_misses,
+        }
+
+    def attach_to_app(self, app: web.Application, path: str):
+        app.router.add_get(path, self._clusters_handler)
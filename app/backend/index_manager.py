@@ -1,9 +1,8 @@
 import os
 import dotenv
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from openai import AzureOpenAI
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes.aio import SearchIndexClient
 from azure.search.documents.aio import SearchClient
@@ -25,6 +24,10 @@ from azure.search.documents.indexes.models import (
     VectorSearchProfile,
 )
 
+from dedup import NearDuplicateDetector
+from embedders import Embedder, check_index_embedder, create_embedder
+from vector_compression import EMBEDDING_DIMENSIONS, VECTOR_COMPRESSION, compression_configuration
+
 dotenv.load_dotenv(override=True)
 
 class IndexManager:
@@ -35,13 +38,18 @@ class IndexManager:
         embedding_model: str,
         endpoint_env_var="AZURE_SEARCH_SERVICE",
         index_name="flat-index",
-        embedding_dimensions=3072,
-        use_int_vectorization=True
+        embedding_dimensions=EMBEDDING_DIMENSIONS,
+        use_int_vectorization=True,
+        vector_compression=VECTOR_COMPRESSION,
+        embedder: Optional[Embedder] = None
     ):
         self.index_name = index_name
         self.embedding_model = embedding_model
-        self.embedding_dimensions = embedding_dimensions
+        # EMBEDDER selects the backend when none is passed; its name and size are recorded in the index
+        self.embedder = embedder or create_embedder(model=embedding_model, dimensions=embedding_dimensions)
+        self.embedding_dimensions = self.embedder.dimensions
         self.use_int_vectorization = use_int_vectorization
+        self.vector_compression = vector_compression
 
         self.azure_search_endpoint = f"https://{service_name}.search.windows.net"
         self.azure_search_credential = AzureKeyCredential(api_key)
@@ -50,19 +58,12 @@ class IndexManager:
             credential=self.azure_search_credential
         )
 
-        # OpenAI client for embedding
-        self.azure_openai_client = AzureOpenAI(
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY")
-        )
-
         self.index = self._build_index()
 
     def _build_index(self) -> SearchIndex:
         fields = [
             (
-                SimpleField(name="id", type="Edm.String", key=True)
+                SimpleField(name="id", type="Edm.String", key=True, sortable=True)
                 if not self.use_int_vectorization
                 else SearchField(
                     name="id",
@@ -114,6 +115,8 @@ class IndexManager:
             ),
         ]
 
+        # The service can only vectorize queries itself with the Azure OpenAI embedder
+        service_vectorizer = self.use_int_vectorization and self.embedder.service_vectorizable
         vectorizers = [
             AzureOpenAIVectorizer(
                 name=f"{self.index_name}-vectorizer",
@@ -125,7 +128,9 @@ class IndexManager:
                     api_key=os.getenv("AZURE_OPENAI_API_KEY"),
                 ),
             )
-        ]
+        ] if service_vectorizer else []
+
+        compression = compression_configuration(self.vector_compression, name="embedding_compression")
 
         index = SearchIndex(
             name=self.index_name,
@@ -152,10 +157,17 @@ class IndexManager:
                     VectorSearchProfile(
                         name="embedding_config",
                         algorithm_configuration_name="hnsw_config",
-                        vectorizer=(f"{self.index_name}-vectorizer" if self.use_int_vectorization else None),
+                        vectorizer=(f"{self.index_name}-vectorizer" if service_vectorizer else None),
+                        compression_configuration_name=(compression.name if compression else None),
+                    ),
+                    # Not used by any field; records which embedder the vectors come from
+                    VectorSearchProfile(
+                        name=self.embedder.profile_name,
+                        algorithm_configuration_name="hnsw_config",
                     ),
                 ],
                 vectorizers=vectorizers,
+                compressions=([compression] if compression else None),
             ),
         )
         return index
@@ -166,13 +178,18 @@ class IndexManager:
             await self.search_index_client.create_index(self.index)
             print(f"Index '{self.index_name}' created successfully.")
         else:
+            check_index_embedder(await self.search_index_client.get_index(self.index_name), self.embedder)
             print(f"Index '{self.index_name}' already exists.")
 
     def _calculate_embedding(self, text: str) -> List[float]:
-        response = self.azure_openai_client.embeddings.create(input=text, model=self.embedding_model)
-        return response.data[0].embedding
+        return self.embedder.embed_one(text)
+
+    def _calculate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed(texts)
 
-    async def upload_documents(self, documents: List[Dict[str, Any]]):
+    async def upload_documents(self, documents: List[Dict[str, Any]], deduplicate: bool = False):
+        if deduplicate:
+            documents = list(NearDuplicateDetector().unique(documents))
         # Calculate embeddings for each document
         for doc in documents:
             # You can decide what field(s) to use for embeddings. Here we use 'description' + 'title'
@@ -202,16 +219,15 @@ if __name__ == "__main__":
         index_name=AZURE_SEARCH_INDEX
         )
     asyncio.run(index_manager.create_index_if_not_exists())
-    import json
+    from dedup import NearDuplicateDetector
+    from ingest import IngestionPipeline
     # Update the path to be relative to the backend directory
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_file_path = os.path.join(current_dir, "data", "flat_data.json")
     
-    # read the documents in data/flat_data.json
+    # stream the documents in data/flat_data.json through the ingestion pipeline
     try:
-        with open(data_file_path, "r") as f:
-            documents = json.load(f)
-        asyncio.run(index_manager.upload_documents(documents))
+        asyncio.run(IngestionPipeline(index_manager, deduplicator=NearDuplicateDetector()).run(data_file_path))
     except FileNotFoundError:
         print(f"Error: Could not find the data file at {data_file_path}")
         print("Please ensure the data file exists in the app/backend/data directory")
\ No newline at end of file
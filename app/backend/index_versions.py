@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import List, Optional
+
+import dotenv
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.indexes.models import SearchAlias
+
+from dedup import NearDuplicateDetector
+from embedders import Embedder
+from index_manager import IndexManager
+from ingest import IngestionPipeline, IngestionStats
+
+logger = logging.getLogger("voicerag")
+
+
+class IndexSwapError(RuntimeError):
+    pass
+
+
+class IndexVersions:
+    """Zero-downtime rebuilds: versioned indexes behind a search alias.
+
+    Queries go to the alias (AZURE_SEARCH_INDEX), which points at one concrete
+    `<alias>-v<timestamp>` index. build() creates and fills a new version while the
+    current one keeps serving, validates it, and then moves the alias in a single
+    conditional update. If validation fails the new index is deleted; if the
+    post-swap check fails the alias is moved back. Only the newest `keep` versions
+    are retained.
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        api_key: str,
+        alias: str,
+        embedding_model: str = "text-embedding-3-large",
+        embedder: Optional[Embedder] = None,
+        keep: int = 2,
+        min_count_ratio: float = 0.9,
+        max_failed_ratio: float = 0.01,
+    ):
+        self.service_name = service_name
+        self.api_key = api_key
+        self.alias = alias
+        self.embedding_model = embedding_model
+        self.embedder = embedder
+        self.keep = keep
+        self.min_count_ratio = min_count_ratio
+        self.max_failed_ratio = max_failed_ratio
+        self._manager = self._index_manager(alias)
+        self.index_client: SearchIndexClient = self._manager.search_index_client
+
+    def _index_manager(self, index_name: str) -> IndexManager:
+        return IndexManager(
+            service_name=self.service_name,
+            api_key=self.api_key,
+            embedding_model=self.embedding_model,
+            index_name=index_name,
+            embedder=self.embedder,
+        )
+
+    def _search_client(self, index_name: str) -> SearchClient:
+        return SearchClient(
+            endpoint=self._manager.azure_search_endpoint,
+            index_name=index_name,
+            credential=self._manager.azure_search_credential,
+        )
+
+    async def versions(self) -> List[str]:
+        # Only <alias>-v<digits>; unrelated indexes like <alias>-vector are left alone
+        pattern = re.compile(rf"{re.escape(self.alias)}-v(\d+)")
+        versions = []
+        async for name in self.index_client.list_index_names():
+            if match := pattern.fullmatch(name):
+                versions.append((int(match.group(1)), name))
+        return [name for _, name in sorted(versions)]
+
+    async def current(self) -> Optional[str]:
+        try:
+            alias = await self.index_client.get_alias(self.alias)
+        except ResourceNotFoundError:
+            return None
+        return alias.indexes[0]
+
+    async def _document_count(self, index_name: str) -> int:
+        async with self._search_client(index_name) as client:
+            return await client.get_document_count()
+
+    async def _wait_for_count(self, index_name: str, expected: int, timeout: float = 120.0) -> int:
+        # Document counts lag uploads by a few seconds while the index refreshes
+        deadline = time.monotonic() + timeout
+        count = await self._document_count(index_name)
+        while count < expected and time.monotonic() < deadline:
+            await asyncio.sleep(2.0)
+            count = await self._document_count(index_name)
+        return count
+
+    async def _serves_queries(self, index_name: str) -> bool:
+        async with self._search_client(index_name) as client:
+            results = await client.search(search_text="*", top=1, select=["id"])
+            return len([doc async for doc in results]) > 0
+
+    async def _check_alias_name_free(self):
+        # An alias can't take the name of an existing index, so the first build would only fail at the swap
+        try:
+            await self.index_client.get_index(self.alias)
+        except ResourceNotFoundError:
+            return
+        raise IndexSwapError(
+            f"'{self.alias}' is a regular index; point AZURE_SEARCH_INDEX at a new alias name "
+            f"or delete the old index after copying it"
+        )
+
+    async def _point_alias(self, index_name: str, expected_current: Optional[str]):
+        if expected_current is None:
+            await self._check_alias_name_free()
+            await self.index_client.create_alias(SearchAlias(name=self.alias, indexes=[index_name]))
+            return
+        alias = await self.index_client.get_alias(self.alias)
+        if alias.indexes[0] != expected_current:
+            raise IndexSwapError(f"Alias '{self.alias}' moved to {alias.indexes[0]} during the build")
+        alias.indexes = [index_name]
+        # Conditional on the ETag, so a concurrent swap makes this one fail instead of being lost
+        await self.index_client.create_or_update_alias(alias, match_condition=MatchConditions.IfNotModified)
+
+    async def build(self, path: str, force: bool = False, **pipeline_options) -> str:
+        """Build a new version from a listings file and switch the alias to it."""
+        current = await self.current()
+        if current is None:
+            await self._check_alias_name_free()
+        version = f"{self.alias}-v{time.time_ns() // 1_000_000}"
+        manager = self._index_manager(version)
+        await manager.search_index_client.create_index(manager.index)
+        logger.info("Building %s (serving %s)", version, current)
+        try:
+            # A rebuild sees every listing, so near-duplicates are dropped across the whole feed
+            pipeline_options.setdefault("deduplicator", NearDuplicateDetector())
+            stats: IngestionStats = await IngestionPipeline(manager, **pipeline_options).run(path)
+            if stats.uploaded == 0:
+                raise IndexSwapError("No listings were uploaded")
+            if stats.failed > self.max_failed_ratio * stats.read:
+                raise IndexSwapError(f"{stats.failed} of {stats.read} listings failed to index")
+            count = await self._wait_for_count(version, stats.uploaded)
+            if current is not None and not force:
+                current_count = await self._document_count(current)
+                if count < self.min_count_ratio * current_count:
+                    raise IndexSwapError(
+                        f"{version} has {count} documents, {current} has {current_count}; use force to swap anyway"
+                    )
+            if not await self._serves_queries(version):
+                raise IndexSwapError(f"{version} returns no results")
+            await self._point_alias(version, current)
+        except BaseException:
+            logger.error("Build of %s failed, deleting it; %s keeps serving", version, current)
+            await manager.search_index_client.delete_index(version)
+            raise
+        finally:
+            await manager.search_index_client.close()
+
+        logger.info("Alias %s now points to %s (%d documents)", self.alias, version, count)
+        if current is not None and not await self._serves_queries(self.alias):
+            logger.error("%s fails through the alias, rolling back to %s", version, current)
+            await self._point_alias(current, version)
+            raise IndexSwapError(f"Rolled back to {current}")
+        await self.cleanup()
+        return version
+
+    async def rollback(self) -> str:
+        """Point the alias back at the newest version older than the current one."""
+        current = await self.current()
+        versions = await self.versions()
+        older = versions[:versions.index(current)] if current in versions else versions
+        if not older:
+            raise IndexSwapError("No older version to roll back to")
+        await self._point_alias(older[-1], current)
+        logger.info("Alias %s rolled back from %s to %s", self.alias, current, older[-1])
+        return older[-1]
+
+    async def cleanup(self) -> List[str]:
+        """Delete all but the newest `keep` versions, never the one being served."""
+        current = await self.current()
+        versions = await self.versions()
+        stale = [v for v in versions[:max(len(versions) - self.keep, 0)] if v != current]
+        for version in stale:
+            await self.index_client.delete_index(version)
+            logger.info("Deleted old index version %s", version)
+        return stale
+
+    async def close(self):
+        await self.index_client.close()
+
+
+async def _main(args: argparse.Namespace):
+    versions = IndexVersions(
+        service_name=os.getenv("AZURE_SEARCH_SERVICE_NAME"),
+        api_key=os.getenv("AZURE_SEARCH_API_KEY"),
+        alias=os.getenv("AZURE_SEARCH_INDEX"),
+        keep=args.keep,
+    )
+    try:
+        if args.command == "build":
+            print("Serving", await versions.build(
+                args.path,
+                force=args.force,
+                batch_size=args.batch_size,
+                embed_workers=args.embed_workers,
+                upload_workers=args.upload_workers,
+            ))
+        elif args.command == "rollback":
+            print("Serving", await versions.rollback())
+        elif args.command == "cleanup":
+            print("Deleted", await versions.cleanup())
+        else:
+            current = await versions.current()
+            for version in await versions.versions():
+                print(("* " if version == current else "  ") + version)
+    finally:
+        await versions.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    dotenv.load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Versioned index builds behind the AZURE_SEARCH_INDEX alias.")
+    parser.add_argument("command", choices=["build", "rollback", "cleanup", "status"])
+    parser.add_argument("path", nargs="?", help="Listings file for build (NDJSON or JSON array)")
+    parser.add_argument("--keep", type=int, default=2, help="Index versions to retain")
+    parser.add_argument("--force", action="store_true", help="Swap even if the new index is much smaller")
+    # The new index isn't serving yet, so it can be filled with larger batches and more workers
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--embed-workers", type=int, default=8)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    args = parser.parse_args()
+    if args.command == "build" and not args.path:
+        parser.error("build needs a listings file")
+    asyncio.run(_main(args))
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import dotenv
+from azure.search.documents.aio import SearchClient
+
+from dedup import NearDuplicateDetector
+from index_manager import IndexManager
+
+logger = logging.getLogger("voicerag")
+
+_REQUIRED_FIELDS = ("id", "title", "description", "location")
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+_EDM_COERCIONS = {
+    "Edm.String": str,
+    "Edm.Double": float,
+    "Edm.Int32": int,
+    "Edm.Int64": int,
+    "Edm.Boolean": _to_bool,
+}
+
+
+def _iter_json_array(f: TextIO, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size).lstrip()
+    if not buf.startswith("["):
+        raise ValueError("Expected a JSON array of listings")
+    pos = 1
+    eof = False
+    while True:
+        # Skip separators between elements
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            if pos >= len(buf):
+                raise json.JSONDecodeError("Need more data", buf, pos)
+            obj, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Element spans the chunk boundary: drop consumed text and read more
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+
+
+def iter_listings(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Yield listings one at a time from an NDJSON file or a JSON array file.
+
+    The format is detected from the first non-whitespace character, so the existing
+    data/flat_data.json and line-delimited exports both work without loading the
+    whole file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(chunk_size).lstrip()[:1]
+        f.seek(0)
+        if head == "[":
+            yield from _iter_json_array(f, chunk_size)
+            return
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("Skipping malformed line %d in %s: %s", line_number, path, e)
+
+
+def write_json_array(records: Iterable[Dict[str, Any]], path: str):
+    """Write records as a JSON array one element at a time instead of dumping a full list."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, record in enumerate(records):
+            if i:
+                f.write(",\n")
+            json.dump(record, f, ensure_ascii=False)
+        f.write("\n]\n")
+
+
+class IngestionStats:
+    read: int
+    invalid: int
+    duplicates: int
+    embedded: int
+    uploaded: int
+    failed: int
+    started: float
+
+    def __init__(self):
+        self.read = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.embedded = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    @property
+    def records_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.uploaded / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"read={self.read} invalid={self.invalid} duplicates={self.duplicates} embedded={self.embedded} "
+                f"uploaded={self.uploaded} failed={self.failed} ({self.records_per_second:.1f} records/s)")
+
+
+class IngestionPipeline:
+    """Streams listings from disk into the search index in bounded memory.
+
+    read -> validate -> embed -> upload run as concurrent stages connected by bounded
+    queues of batches, so at most roughly (queue_size * stages * batch_size) listings
+    are held in memory regardless of the input size.
+    """
+
+    def __init__(
+        self,
+        index_manager: IndexManager,
+        batch_size: int = 16,
+        queue_size: int = 4,
+        embed_workers: int = 4,
+        upload_workers: int = 2,
+        progress_interval: float = 5.0,
+        deduplicator: Optional[NearDuplicateDetector] = None,
+    ):
+        self.index_manager = index_manager
+        self.deduplicator = deduplicator
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.embed_workers = embed_workers
+        self.upload_workers = upload_workers
+        self.progress_interval = progress_interval
+        self.stats = IngestionStats()
+        # Only fields present in the index schema may be uploaded
+        self._field_types = {
+            field.name: field.type for field in index_manager.index.fields if field.name != "embedding"
+        }
+
+    def validate(self, record: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(record, dict) or any(not record.get(f) for f in _REQUIRED_FIELDS):
+            return None
+        doc = {}
+        for name, edm_type in self._field_types.items():
+            value = record.get(name)
+            if value is None:
+                continue
+            try:
+                doc[name] = _EDM_COERCIONS.get(edm_type, lambda v: v)(value)
+            except (TypeError, ValueError):
+                return None
+        if isinstance(record.get("embedding"), list):
+            doc["embedding"] = record["embedding"]
+        return doc
+
+    def _take(self, records: Iterator[Any]) -> List[Any]:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                break
+        return batch
+
+    async def _read(self, records: Iterator[Any], out: asyncio.Queue):
+        while batch := await asyncio.to_thread(self._take, records):
+            self.stats.read += len(batch)
+            await out.put(batch)
+        await out.put(None)
+
+    async def _validate(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while (batch := await inp.get()) is not None:
+            valid = [doc for doc in map(self.validate, batch) if doc is not None]
+            self.stats.invalid += len(batch) - len(valid)
+            if self.deduplicator is not None:
+                # Drop near-duplicates before they cost an embedding call
+                unique = await asyncio.to_thread(lambda: list(self.deduplicator.unique(valid)))
+                self.stats.duplicates += len(valid) - len(unique)
+                valid = unique
+            if valid:
+                await out.put(valid)
+        for _ in range(self.embed_workers):
+            await out.put(None)
+
+    async def _embed(self, inp: asyncio.Queue, out: asyncio.Queue):
+        while (batch := await inp.get()) is not None:
+            pending = [doc for doc in batch if "embedding" not in doc]
+            if pending:
+                texts = [f"{doc.get('title', '')} {doc.get('description', '')}".strip() for doc in pending]
+                try:
+                    embeddings = await asyncio.to_thread(self.index_manager._calculate_embeddings, texts)
+                except Exception as e:
+                    logger.error("Embedding batch of %d failed: %s", len(pending), e)
+                    self.stats.failed += len(pending)
+                    batch = [doc for doc in batch if "embedding" in doc]
+                    embeddings = []
+                for doc, embedding in zip(pending, embeddings):
+                    doc["embedding"] = embedding
+            self.stats.embedded += len(batch)
+            if batch:
+                await out.put(batch)
+
+    async def _upload(self, search_client: SearchClient, inp: asyncio.Queue):
+        while (batch := await inp.get()) is not None:
+            try:
+                results = await search_client.merge_or_upload_documents(documents=batch)
+            except Exception as e:
+                logger.error("Upload batch of %d failed: %s", len(batch), e)
+                self.stats.failed += len(batch)
+                continue
+            succeeded = sum(1 for r in results if r.succeeded)
+            self.stats.uploaded += succeeded
+            self.stats.failed += len(results) - succeeded
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            logger.info("Ingestion progress: %s", self.stats)
+
+    async def run(self, path: str) -> IngestionStats:
+        self.stats = IngestionStats()
+        read_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        embed_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+        upload_q: asyncio.Queue = asyncio.Queue(self.queue_size)
+
+        async with SearchClient(
+            endpoint=self.index_manager.azure_search_endpoint,
+            index_name=self.index_manager.index_name,
+            credential=self.index_manager.azure_search_credential,
+        ) as search_client:
+            progress = asyncio.create_task(self._report_progress())
+            producers = [asyncio.create_task(self._read(iter_listings(path), read_q)),
+                         asyncio.create_task(self._validate(read_q, embed_q))]
+            embedders = [asyncio.create_task(self._embed(embed_q, upload_q)) for _ in range(self.embed_workers)]
+            uploaders = [asyncio.create_task(self._upload(search_client, upload_q))
+                         for _ in range(self.upload_workers)]
+            tasks = [progress, *producers, *embedders, *uploaders]
+            try:
+                await asyncio.gather(*producers)
+                await asyncio.gather(*embedders)
+                for _ in range(self.upload_workers):
+                    await upload_q.put(None)
+                await asyncio.gather(*uploaders)
+            finally:
+                # A failed read leaves the workers blocked on their queues; don't leak them
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        logger.info("Ingestion finished: %s", self.stats)
+        return self.stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    dotenv.load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Stream listings from an NDJSON or JSON array file into the search index.")
+    parser.add_argument("path", help="Path to an NDJSON (.ndjson/.jsonl) or JSON array file")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--upload-workers", type=int, default=2)
+    parser.add_argument("--create-index", action="store_true", help="Create the index first if it does not exist")
+    parser.add_argument("--no-dedup", action="store_true", help="Index near-duplicate listings too")
+    args = parser.parse_args()
+
+    index_manager = IndexManager(
+        service_name=os.getenv("AZURE_SEARCH_SERVICE_NAME"),
+        api_key=os.getenv("AZURE_SEARCH_API_KEY"),
+        embedding_model="text-embedding-3-large",
+        index_name=os.getenv("AZURE_SEARCH_INDEX"),
+    )
+    if args.create_index:
+        asyncio.run(index_manager.create_index_if_not_exists())
+
+    pipeline = IngestionPipeline(
+        index_manager,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        embed_workers=args.embed_workers,
+        upload_workers=args.upload_workers,
+        deduplicator=None if args.no_dedup else NearDuplicateDetector(),
+    )
+    stats = asyncio.run(pipeline.run(args.path))
+    print(f"Ingested {stats.uploaded} listings ({stats.records_per_second:.1f} records/s), "
+          f"{stats.invalid} invalid, {stats.duplicates} duplicates, {stats.failed} failed")
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from cosmos_indexer import AsyncCosmosFlatListingService
+
+logger = logging.getLogger("voicerag")
+
+
+class _PartitionEntry:
+    items: List[Dict[str, Any]]
+    version: tuple[int, int]
+    session_token: Optional[str]
+    read_charge: float
+    expires_at: float
+
+    def __init__(self, items, version, session_token, read_charge, expires_at):
+        self.items = items
+        self.version = version
+        self.session_token = session_token
+        self.read_charge = read_charge
+        self.expires_at = expires_at
+
+
+class PartitionCache:
+    """Read-through cache of Cosmos DB listings keyed by partition (location).
+
+    Fresh entries are served from memory. Once an entry's TTL passes it is revalidated
+    with a cheap count/_ts fingerprint query (read with the session token of the
+    original read) and only re-read in full if the partition actually changed.
+    Concurrent misses for the same location share a single Cosmos read.
+    """
+
+    def __init__(
+        self,
+        service: AsyncCosmosFlatListingService,
+        ttl: float = 300.0,
+        max_items: int = 20_000,
+    ):
+        self.service = service
+        self.ttl = ttl
+        # Memory is bounded by the number of cached listings rather than partitions,
+        # since district sizes vary a lot.
+        self.max_items = max_items
+
+        self._entries: OrderedDict[str, _PartitionEntry] = OrderedDict()
+        self._cached_items = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Bumped by writes, so a read that started before one doesn't cache what it saw
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.ru_spent = 0.0
+        self.ru_saved = 0.0
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "partitions": len(self._entries),
+            "cached_items": self._cached_items,
+            "ru_spent": round(self.ru_spent, 2),
+            "ru_saved": round(self.ru_saved, 2),
+        }
+
+    async def query_flat_listings(self, location: str) -> List[Dict[str, Any]]:
+        entry = self._entries.get(location)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(location)
+            self.hits += 1
+            self.ru_saved += entry.read_charge
+            return entry.items
+
+        task = self._inflight.get(location)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._load(location, entry))
+            self._inflight[location] = task
+            task.add_done_callback(lambda done: self._forget_inflight(location, done))
+        # Shield so a cancelled caller doesn't abort the read other callers are waiting on
+        return (await asyncio.shield(task)).items
+
+    async def save_flat_listing(self, listing_data: Dict[str, Any]) -> Dict[str, Any]:
+        response, charge = await self.service.save_flat_listing(listing_data)
+        self.ru_spent += charge
+        self.invalidate(listing_data.get("location"))
+        return response
+
+    def invalidate(self, location: Optional[str] = None):
+        if location is None:
+            self._epoch += 1
+            self._inflight.clear()
+            self._entries.clear()
+            self._cached_items = 0
+        else:
+            self._generations[location] = self._generations.get(location, 0) + 1
+            # Later readers must not coalesce onto a read that started before the write
+            self._inflight.pop(location, None)
+            self._drop(location)
+
+    def _generation(self, location: str) -> tuple[int, int]:
+        return self._epoch, self._generations.get(location, 0)
+
+    def _forget_inflight(self, location: str, task: asyncio.Task):
+        if self._inflight.get(location) is task:
+            del self._inflight[location]
+
+    def _drop(self, location: str):
+        if (entry := self._entries.pop(location, None)) is not None:
+            self._cached_items -= len(entry.items)
+
+    async def _load(self, location: str, stale: Optional[_PartitionEntry]) -> _PartitionEntry:
+        if stale is not None:
+            version, charge = await self.service.partition_version(location, session_token=stale.session_token)
+            self.ru_spent += charge
+            # The entry may have been invalidated by a write or evicted while we waited;
+            # then read the partition again rather than trusting the old items
+            if version == stale.version and self._entries.get(location) is stale:
+                self.revalidations += 1
+                self.ru_saved += max(stale.read_charge - charge, 0.0)
+                stale.expires_at = time.monotonic() + self.ttl
+                self._entries.move_to_end(location)
+                return stale
+
+        self.misses += 1
+        generation = self._generation(location)
+        # Fingerprint first so a write racing with the read makes the entry look stale, not fresh
+        version, version_charge = await self.service.partition_version(location)
+        items, charge = await self.service.read_flat_listings(location)
+        self.ru_spent += version_charge + charge.total
+        entry = _PartitionEntry(items, version, charge.session_token, charge.total, time.monotonic() + self.ttl)
+        if self._generation(location) == generation:
+            self._store(location, entry)
+        logger.debug("Cached %d listings for %s (%.2f RU)", len(items), location, charge.total)
+        return entry
+
+    def _store(self, location: str, entry: _PartitionEntry):
+        self._drop(location)
+        if len(entry.items) > self.max_items:
+            # Larger than the whole cache; serve it once without caching
+            return
+        self._entries[location] = entry
+        self._cached_items += len(entry.items)
+        while self._cached_items > self.max_items:
+            _, evicted = self._entries.popitem(last=False)
+            self._cached_items -= len(evicted.items)
+            self.evictions += 1
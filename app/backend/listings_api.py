@@ -0,0 +1,231 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from search_manager import LISTING_FIELDS, SearchManager, preferences_filter
+from static_files import etag_matches
+
+logger = logging.getLogger("voicerag")
+
+# Azure AI Search document keys may only contain these characters
+_VALID_ID = re.compile(r"^[A-Za-z0-9_\-=]{1,128}$")
+MAX_IDS_PER_REQUEST = 50
+
+SEARCH_PAGE_SIZE = int(os.getenv("LISTINGS_SEARCH_PAGE_SIZE", 100))
+# The service caps a single request at 1000 documents and $skip at 100000
+MAX_SEARCH_PAGE_SIZE = 1000
+MAX_SEARCH_SKIP = 100000
+MAX_SEARCH_LIMIT = 10000
+_FEATURES = ("balcony", "parking", "elevator", "furnished", "pets", "garden", "storage", "laundry")
+
+
+def _parse_bool(name: str, value: str) -> bool:
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise web.HTTPBadRequest(text=f"'{name}' must be true or false")
+
+
+def _parse_number(query, name: str, kind=float, minimum=None, maximum=None, default=None):
+    if name not in query:
+        return default
+    try:
+        value = kind(query[name])
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"'{name}' must be a number")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise web.HTTPBadRequest(text=f"'{name}' must be between {minimum} and {maximum}")
+    return value
+
+
+def _preferences_from_query(query) -> Dict[str, Any]:
+    """Query parameters in the update_preferences shape: budget_min=..&size_max=..&balcony=true"""
+    return {
+        "budget": {"min": _parse_number(query, "budget_min"), "max": _parse_number(query, "budget_max")},
+        "size": {"min": _parse_number(query, "size_min"), "max": _parse_number(query, "size_max")},
+        "rooms": _parse_number(query, "rooms"),
+        "location": query.get("location"),
+        "features": {name: _parse_bool(name, query[name]) for name in _FEATURES if name in query},
+    }
+
+
+def _encode_cursor(skip: int, filter_str: Optional[str]) -> str:
+    payload = json.dumps({"skip": skip, "filter": _filter_key(filter_str)}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, filter_str: Optional[str]) -> int:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        skip = int(payload["skip"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text="Invalid cursor")
+    # A cursor only means something for the filters it was issued for
+    if payload.get("filter") != _filter_key(filter_str) or skip < 0:
+        raise web.HTTPBadRequest(text="Cursor does not match the request filters")
+    return skip
+
+
+def _filter_key(filter_str: Optional[str]) -> str:
+    return hashlib.sha256((filter_str or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ListingDetailsCache:
+    """In-process LRU of full listing records with a TTL, keyed by listing id."""
+
+    def __init__(self, capacity: int = 2048, ttl: float = 300.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, listing_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(listing_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(listing_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, listing: Dict[str, Any]):
+        listing_id = listing.get("id")
+        if not listing_id:
+            return
+        self._entries[listing_id] = (
+            time.monotonic() + self.ttl,
+            {field: listing.get(field) for field in LISTING_FIELDS},
+        )
+        self._entries.move_to_end(listing_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class ListingsApi:
+    """Listing endpoints for the frontend.
+
+    GET /api/listings?ids=1,2,3 returns full listing records in one batched lookup.
+    Search tool results only carry ids and short summaries; the frontend hydrates
+    cards and map pins from here. Records come from the in-process cache (primed by
+    the search tool) and only the missing ids are fetched from the index.
+
+    GET /api/listings/search streams every listing matching update_preferences-style
+    filters as NDJSON, one line per page of `page_size` listings, so the map and list
+    views can render while later pages are still being fetched. A request stops after
+    `limit` listings; the last line carries a `cursor` to continue from. Pages are
+    ordered by id; on indexes built before id was sortable lines say "unordered".
+    """
+
+    def __init__(
+        self,
+        search_manager: SearchManager,
+        cache: ListingDetailsCache,
+        max_age: int = 300,
+        page_size: int = SEARCH_PAGE_SIZE,
+    ):
+        self.search_manager = search_manager
+        self.cache = cache
+        self.max_age = max_age
+        self.page_size = page_size
+
+    async def get_listings(self, ids: List[str]) -> List[Dict[str, Any]]:
+        found = {}
+        missing = []
+        for listing_id in ids:
+            listing = self.cache.get(listing_id)
+            if listing is not None:
+                found[listing_id] = listing
+            else:
+                missing.append(listing_id)
+        if missing:
+            for listing in await self.search_manager.get_listings_by_ids(missing):
+                self.cache.put(listing)
+                found[listing["id"]] = listing
+        return [found[listing_id] for listing_id in ids if listing_id in found]
+
+    async def _listings_handler(self, request: web.Request) -> web.Response:
+        ids = list(dict.fromkeys(i.strip() for i in request.query.get("ids", "").split(",") if i.strip()))
+        if not ids:
+            raise web.HTTPBadRequest(text="Query parameter 'ids' is required")
+        if len(ids) > MAX_IDS_PER_REQUEST:
+            raise web.HTTPBadRequest(text=f"At most {MAX_IDS_PER_REQUEST} ids per request")
+        if not all(_VALID_ID.match(i) for i in ids):
+            raise web.HTTPBadRequest(text="Invalid listing id")
+
+        body = json.dumps({"listings": await self.get_listings(ids)}, ensure_ascii=False).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}"}
+        if etag_matches(request, etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, headers=headers, content_type="application/json")
+
+    async def _search_handler(self, request: web.Request) -> web.StreamResponse:
+        query = request.query
+        filter_str = preferences_filter(_preferences_from_query(query))
+        page_size = _parse_number(query, "page_size", int, 1, MAX_SEARCH_PAGE_SIZE, self.page_size)
+        limit = _parse_number(query, "limit", int, 1, MAX_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+        skip = _decode_cursor(query["cursor"], filter_str) if "cursor" in query else 0
+        end = min(skip + limit, MAX_SEARCH_SKIP)
+
+        def fetch(offset: int) -> asyncio.Task:
+            return asyncio.create_task(self.search_manager.search_page(
+                filter_str, offset, min(page_size, end - offset), include_total_count=offset == skip))
+
+        response = web.StreamResponse(headers={"Cache-Control": "no-store"})
+        response.content_type = "application/x-ndjson"
+        await response.prepare(request)
+
+        page = 0
+        offset = skip
+        pending = fetch(offset) if offset < end else None
+        try:
+            while pending is not None:
+                requested = min(page_size, end - offset)
+                docs, total = await pending
+                offset += len(docs)
+                # A short page means the results are exhausted
+                full = len(docs) == requested
+                # Fetch the next page while this one is written to the client
+                pending = fetch(offset) if full and offset < end else None
+                line: Dict[str, Any] = {
+                    "page": page,
+                    "listings": docs,
+                    "cursor": _encode_cursor(offset, filter_str) if full and offset < MAX_SEARCH_SKIP else None,
+                }
+                if total is not None:
+                    line["total"] = total
+                if not self.search_manager.sortable_id:
+                    # Unordered index: pages (and cursors) may overlap or skip listings between requests
+                    line["unordered"] = True
+                await response.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+                page += 1
+        except (ConnectionResetError, asyncio.CancelledError):
+            if pending is not None:
+                pending.cancel()
+            raise
+        except Exception as e:
+            logger.error("Listing search stream failed after %d pages: %s", page, e)
+            line = {"page": page, "error": "search_failed", "cursor": _encode_cursor(offset, filter_str)}
+            await response.write(json.dumps(line).encode("utf-8") + b"\n")
+        await response.write_eof()
+        return response
+
+    def attach_to_app(self, app: web.Application, path: str):
+        app.router.add_get(path, self._listings_handler)
+        app.router.add_get(f"{path}/search", self._search_handler)
@@ -0,0 +1,22 @@
+from typing import Any, Callable, Dict
+
+from aiohttp import web
+
+
+class MetricsRegistry:
+    """Collects JSON-serialisable metric snapshots from components for GET /metrics."""
+
+    def __init__(self):
+        self._providers: Dict[str, Callable[[], Any]] = {}
+
+    def register(self, name: str, provider: Callable[[], Any]):
+        self._providers[name] = provider
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: provider() for name, provider in self._providers.items()}
+
+    async def _metrics_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot(), headers={"Cache-Control": "no-store"})
+
+    def attach_to_app(self, app: web.Application, path: str):
+        app.router.add_get(path, self._metrics_handler)
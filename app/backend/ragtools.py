@@ -1,10 +1,21 @@
-from typing import Any
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional
 
+from facets import FacetCache
+from listings_api import ListingDetailsCache
+from rerank import RERANK_CANDIDATES, RerankWeights, rerank
+from resilience import Hedger, LatencyTracker
 from search_manager import SearchManager
+from shared_store import ListingSnapshot, SharedListingStore
+from tool_executors import ToolExecutionMode, ToolExecutors, worker_listing_snapshot
 from azure.core.credentials import AzureKeyCredential
 from azure.identity import DefaultAzureCredential
 
-from rtmt import RTMiddleTier, Tool, ToolResult, ToolResultDirection
+from rtmt import RTMiddleTier, Tool, ToolResult, ToolResultDirection, session_state
 
 _search_tool_schema = {
     "type": "function",
@@ -74,55 +85,211 @@ _update_preferences_schema = {
     }
 }
 
+def _to_listing(r: Any) -> dict:
+    # Extract listing details from the search result. These field names must match your index schema.
+    return {
+        "id": r.get("id", "unknown_id"),
+        "title": r.get("title", ""),
+        "description": r.get("description", ""),
+        "location": r.get("location", ""),
+        "price": r.get("price", 0.0),
+        "contact": r.get("contact", ""),
+        "rooms": r.get("rooms", 0),
+        "size": r.get("size", 0),
+        "floor": r.get("floor", 0),
+        "availability": r.get("availability", ""),
+        "lat": r.get("lat", 0.0),
+        "lng": r.get("lng", 0.0),
+    }
+
+
+class _RecentResults:
+    """Last search results per query, used as the first fallback when search is too slow."""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._results: OrderedDict[str, list] = OrderedDict()
+
+    def get(self, query: str) -> Optional[list]:
+        key = query.strip().lower()
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        return None
+
+    def put(self, query: str, listings: list):
+        key = query.strip().lower()
+        self._results[key] = listings
+        self._results.move_to_end(key)
+        while len(self._results) > self.capacity:
+            self._results.popitem(last=False)
+
+
+def _local_keyword_search(snapshot: Optional[ListingSnapshot], query: str, k: int) -> list:
+    if snapshot is None or len(snapshot) == 0:
+        return []
+    terms = set(re.findall(r"\w+", query.lower()))
+    scored = []
+    for row in range(len(snapshot)):
+        text = " ".join(snapshot.text(name, row) for name in ("title", "location", "description"))
+        score = len(terms & set(re.findall(r"\w+", text.lower())))
+        if score:
+            scored.append((score, row))
+    scored.sort(reverse=True)
+    return [_to_listing(snapshot.listing(row)) for _, row in scored[:k]]
+
+
+def _keyword_search_in_worker(args: tuple) -> list:
+    # PROCESS-mode target: scans the snapshot mapped by the tool pool process, off the event loop's GIL
+    query, k = args
+    return _local_keyword_search(worker_listing_snapshot(), query, k)
+
+
+def _summarize(listing: dict, max_length: int = 100) -> dict:
+    # Model-facing view of a listing: enough to talk about it, full details via /api/listings
+    description = listing.get("description") or ""
+    if len(description) > max_length:
+        description = description[:max_length].rsplit(" ", 1)[0] + "..."
+    return {
+        "id": listing.get("id"),
+        "title": listing.get("title"),
+        "location": listing.get("location"),
+        "price": listing.get("price"),
+        "rooms": listing.get("rooms"),
+        "size": listing.get("size"),
+        "summary": description,
+    }
+
+
 async def _search_tool(
     search_manager, 
+    hedger: Hedger,
+    recent: _RecentResults,
+    details: Optional[ListingDetailsCache],
+    weights: RerankWeights,
+    rerank_time: LatencyTracker,
     args: Any
 ) -> ToolResult:
     print(f"Searching for '{args['query']}' in the knowledge base.")
-    # Use the SearchManager to get vector-based search results
-    results = await search_manager.search_by_embedding(args['query'], k=5)
-
-    listings = []
-    for r in results:
-        # Extract listing details from the search result. These field names must match your index schema.
-        listing = {
-            "id": r.get("id", "unknown_id"),
-            "title": r.get("title", ""),
-            "description": r.get("description", ""),
-            "location": r.get("location", ""),
-            "price": r.get("price", 0.0),
-            "contact": r.get("contact", ""),
-            "rooms": r.get("rooms", 0),
-            "size": r.get("size", 0),
-            "floor": r.get("floor", 0),
-            "availability": r.get("availability", ""),
-            "lat": r.get("lat", 0.0),
-            "lng": r.get("lng", 0.0),
-        }
-        listings.append(listing)
+    # Use the SearchManager to get vector-based search results, hedged against slow requests.
+    # Identical concurrent queries share one search; the hedge bypasses that so it isn't
+    # just another wait on the slow request
+    candidates = await hedger.call(
+        lambda: search_manager.search_by_embedding(args['query'], k=RERANK_CANDIDATES),
+        hedge=lambda: search_manager.search_by_embedding(args['query'], k=RERANK_CANDIDATES, coalesce=False),
+    )
+    # Rerank the wider candidate set against the preferences gathered in this session
+    started = time.perf_counter()
+    results = rerank(candidates, session_state.get({}).get("preferences"), k=5, weights=weights)
+    rerank_time.observe(time.perf_counter() - started)
+
+    # Full records go to the details cache behind /api/listings; the tool output only
+    # carries ids and short summaries, which keeps model input and socket traffic small
+    if details is not None:
+        for r in results:
+            details.put(r)
+    listings = [_summarize(_to_listing(r)) for r in results]
+    recent.put(args['query'], listings)
 
     # Return the listings list as JSON to the frontend
     return ToolResult({"listings": listings}, ToolResultDirection.TO_CLIENT)
 
 
+async def _search_fallback(
+    listing_store: Optional[SharedListingStore],
+    executors: ToolExecutors,
+    recent: _RecentResults,
+    args: Any
+) -> ToolResult:
+    listings = recent.get(args['query'])
+    if listings is None and listing_store is not None:
+        found = await executors.run(ToolExecutionMode.PROCESS, _keyword_search_in_worker, (args['query'], 5))
+        listings = [_summarize(listing) for listing in found]
+    return ToolResult({"listings": listings or []}, ToolResultDirection.TO_CLIENT, degraded=True)
+
+
+_count_listings_schema = {
+    "type": "function",
+    "name": "count_listings",
+    "description": "Count the flat listings matching the given filters and get their price and size distribution, "
+                   "number of rooms and locations. Use this for 'how many' or 'what's the typical price' questions "
+                   "instead of searching; it does not return individual listings. Rooms is a minimum, the rooms "
+                   "breakdown in the result gives exact counts.",
+    "parameters": {
+        "type": "object",
+        "properties": _update_preferences_schema["parameters"]["properties"],
+        "required": [],
+        "additionalProperties": False
+    }
+}
+
+
+async def _count_listings_tool(facets: FacetCache, args: Any) -> ToolResult:
+    return ToolResult(await facets.count(args), ToolResultDirection.TO_SERVER)
+
+
+def _merge_preferences(current: dict, update: dict) -> dict:
+    merged = dict(current)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
 async def _update_preferences_tool(args: Any) -> ToolResult:
+    state = session_state.get(None)
+    if state is not None:
+        state["preferences"] = _merge_preferences(state.get("preferences", {}), args)
     return ToolResult({
         "action": "update_preferences",
         "preferences": args
     }, ToolResultDirection.TO_CLIENT)
 
 
+async def warm_up_search_credentials(credentials: AzureKeyCredential | DefaultAzureCredential) -> None:
+    # Warm this up before we start getting requests, without blocking the event loop
+    if not isinstance(credentials, AzureKeyCredential):
+        await asyncio.to_thread(credentials.get_token, "https://search.azure.com/.default")
+
+
+def _microseconds(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1e6, 1) if seconds is not None else None
+
+
 def attach_rag_tools(rtmt: RTMiddleTier,
     credentials: AzureKeyCredential | DefaultAzureCredential,
     search_manager: SearchManager, 
+    listing_store: Optional[SharedListingStore] = None,
+    listing_details: Optional[ListingDetailsCache] = None,
     ) -> None:
-    
-    if not isinstance(credentials, AzureKeyCredential):
-        credentials.get_token("https://search.azure.com/.default") # warm this up before we start getting requests
 
+    # The embedding call blocks; run it on the bounded tool thread pool, where its queueing
+    # shows up in the executor metrics. The search tool itself stays INLINE, since the rest
+    # of it awaits hedged, coalesced search requests
+    search_manager.run_blocking = lambda target, arg: rtmt.executors.run(ToolExecutionMode.THREAD, target, arg)
+    hedger = Hedger()
+    recent = _RecentResults()
+    weights = RerankWeights()
+    rerank_time = LatencyTracker(window=500, min_samples=1)
     rtmt.tools["search"] = Tool(
         schema=_search_tool_schema, 
-        target=lambda args: _search_tool(search_manager, args)
+        target=lambda args: _search_tool(search_manager, hedger, recent, listing_details, weights, rerank_time, args),
+        deadline=float(os.getenv("SEARCH_TOOL_DEADLINE_SECONDS", 2.5)),
+        fallback=lambda args: _search_fallback(listing_store, rtmt.executors, recent, args),
+        extra_metrics=lambda: {
+            "hedging": hedger.metrics,
+            "rerank_us_p50": _microseconds(rerank_time.percentile(0.5)),
+            "rerank_us_p99": _microseconds(rerank_time.percentile(0.99)),
+        }
+    )
+
+    facets = FacetCache(search_manager, listing_store)
+    rtmt.tools["count_listings"] = Tool(
+        schema=_count_listings_schema,
+        target=lambda args: _count_listings_tool(facets, args),
+        extra_metrics=lambda: {"facet_cache": facets.metrics}
     )
 
     rtmt.tools["update_preferences"] = Tool(
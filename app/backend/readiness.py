@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger("voicerag")
+
+
+class Readiness:
+    """Runs warm-up tasks in the background after the worker starts serving.
+
+    /health stays a pure liveness probe; /ready only returns 200 once every
+    registered warm-up (tokens, clients, caches) has succeeded. Failed warm-ups are
+    retried with backoff instead of failing the worker, except for the exception
+    types a check declares permanent; those leave the worker unready for good.
+    """
+
+    def __init__(self, max_backoff: float = 30.0):
+        self.started = time.perf_counter()
+        self.max_backoff = max_backoff
+        self._checks: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._permanent: Dict[str, tuple[type[BaseException], ...]] = {}
+        self._completed: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.ready_after: Optional[float] = None
+
+    def add(self, name: str, warm_up: Callable[[], Awaitable[Any]],
+            permanent: tuple[type[BaseException], ...] = ()):
+        self._checks[name] = warm_up
+        self._permanent[name] = permanent
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    async def _run(self, name: str, warm_up: Callable[[], Awaitable[Any]]):
+        backoff = 1.0
+        while True:
+            try:
+                await warm_up()
+                break
+            except self._permanent[name] as e:
+                # Retrying can't fix it (e.g. a misconfiguration); don't hammer the dependency
+                self._errors[name] = str(e)
+                logger.error("Warm-up '%s' failed permanently, the worker stays unready: %s", name, e)
+                return
+            except Exception as e:
+                self._errors[name] = str(e)
+                logger.warning("Warm-up '%s' failed, retrying in %.0fs: %s", name, backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        self._errors.pop(name, None)
+        self._completed[name] = time.perf_counter() - self.started
+        logger.info("Warm-up '%s' done after %.2fs", name, self._completed[name])
+        if len(self._completed) == len(self._checks):
+            self.ready_after = time.perf_counter() - self.started
+            logger.info("Worker ready %.2fs after cold start", self.ready_after)
+
+    async def _on_startup(self, app: web.Application):
+        self._tasks = [asyncio.create_task(self._run(name, fn)) for name, fn in self._checks.items()]
+        if not self._checks:
+            self.ready_after = time.perf_counter() - self.started
+
+    async def _on_cleanup(self, app: web.Application):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _ready_handler(self, request: web.Request) -> web.Response:
+        body = {
+            "ready": self.ready,
+            "cold_start_to_ready_seconds": self.ready_after,
+            "completed": {name: round(t, 3) for name, t in self._completed.items()},
+            "pending": [name for name in self._checks if name not in self._completed],
+            "errors": self._errors,
+        }
+        return web.json_response(body, status=200 if self.ready else 503)
+
+    def attach_to_app(self, app: web.Application, path: str):
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        app.router.add_get(path, self._ready_handler)
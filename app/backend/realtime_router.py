@@ -0,0 +1,124 @@
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+class RealtimeTarget:
+    """One realtime endpoint/deployment pair and what recent connects to it looked like."""
+
+    endpoint: str
+    deployment: str
+    # Overrides the middle tier's credentials, e.g. for an Azure OpenAI resource with its own key
+    key: Optional[str]
+
+    def __init__(self, endpoint: str, deployment: str, key: Optional[str] = None):
+        self.endpoint = endpoint.rstrip("/")
+        self.deployment = deployment
+        self.key = key
+        self.connect_seconds: Optional[float] = None
+        self.cooldown_until = 0.0
+        self.active = 0
+        self.connects = 0
+        self.throttles = 0
+        self.failures = 0
+        self._throttled_at: deque[float] = deque()
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}|{self.deployment}"
+
+    def recent_throttles(self, window: float, now: float) -> int:
+        while self._throttled_at and self._throttled_at[0] < now - window:
+            self._throttled_at.popleft()
+        return len(self._throttled_at)
+
+
+def parse_realtime_targets(spec: Optional[str]) -> List[RealtimeTarget]:
+    """Targets from a comma-separated list of "endpoint|deployment" or "endpoint|deployment|api-key"."""
+    targets = []
+    for entry in (spec or "").split(","):
+        if entry.strip():
+            parts = [part.strip() for part in entry.split("|")]
+            if len(parts) not in (2, 3) or not all(parts):
+                raise ValueError(f"Realtime target '{entry}' is not endpoint|deployment[|api-key]")
+            targets.append(RealtimeTarget(*parts))
+    return targets
+
+
+class RealtimeRouter:
+    """Picks the upstream realtime target for each new session.
+
+    Targets are ranked by their smoothed connect latency plus `throttle_penalty`
+    seconds per 429 in the last `window` seconds; targets that have never been
+    connected to rank first so each gets measured, and ties go to the one with
+    fewer active sessions. A connect failure other than a 429 benches the target
+    for `cooldown` seconds. Callers try targets in order() until one connects.
+    """
+
+    def __init__(
+        self,
+        targets: List[RealtimeTarget],
+        window: float = 60.0,
+        throttle_penalty: float = 2.0,
+        cooldown: float = 30.0,
+        smoothing: float = 0.3,
+    ):
+        if not targets:
+            raise ValueError("At least one realtime target is required")
+        self.targets = targets
+        self.window = window
+        self.throttle_penalty = throttle_penalty
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.failovers = 0
+
+    def _score(self, target: RealtimeTarget, now: float) -> tuple:
+        latency = target.connect_seconds or 0.0
+        return (
+            target.cooldown_until > now,
+            latency + self.throttle_penalty * target.recent_throttles(self.window, now),
+            target.active,
+        )
+
+    def order(self) -> List[RealtimeTarget]:
+        """All targets, best first; benched ones last so they are still a last resort."""
+        now = time.monotonic()
+        return sorted(self.targets, key=lambda target: self._score(target, now))
+
+    def record_connect(self, target: RealtimeTarget, seconds: float):
+        target.connects += 1
+        target.cooldown_until = 0.0
+        if target.connect_seconds is None:
+            target.connect_seconds = seconds
+        else:
+            target.connect_seconds += self.smoothing * (seconds - target.connect_seconds)
+
+    def record_throttled(self, target: RealtimeTarget):
+        target.throttles += 1
+        target._throttled_at.append(time.monotonic())
+
+    def record_failure(self, target: RealtimeTarget):
+        target.failures += 1
+        target.cooldown_until = time.monotonic() + self.cooldown
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        order = self.order()
+        return {
+            "failovers": self.failovers,
+            "preferred": order[0].name,
+            "targets": {
+                target.name: {
+                    "rank": order.index(target),
+                    "connect_seconds": round(target.connect_seconds, 4) if target.connect_seconds is not None else None,
+                    "recent_throttles": target.recent_throttles(self.window, now),
+                    "cooling_down": target.cooldown_until > now,
+                    "active": target.active,
+                    "connects": target.connects,
+                    "throttles": target.throttles,
+                    "failures": target.failures,
+                }
+                for target in self.targets
+            },
+        }
@@ -0,0 +1,127 @@
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 50))
+
+# update_preferences features that exist as listing fields
+_FEATURE_FIELDS = {"balcony": "balcony", "elevator": "elevator", "furnished": "furnished", "pets": "pets_allowed"}
+_EARTH_RADIUS_KM = 6371.0
+
+
+class RerankWeights:
+    """Weights of the reranking terms; RERANK_WEIGHTS="price=2,geo=0" overrides the defaults."""
+
+    similarity: float = 1.0
+    price: float = 1.0
+    size: float = 0.5
+    rooms: float = 0.5
+    features: float = 0.5
+    geo: float = 0.5
+
+    def __init__(self, spec: Optional[str] = os.getenv("RERANK_WEIGHTS"), **weights: float):
+        for part in (spec or "").split(","):
+            if part.strip():
+                name, _, value = part.partition("=")
+                weights.setdefault(name.strip(), float(value))
+        for name, value in weights.items():
+            if not hasattr(RerankWeights, name):
+                raise ValueError(f"Unknown rerank weight '{name}'")
+            setattr(self, name, float(value))
+
+
+_COLUMNS = ["@search.score", "price", "size", "rooms", "lat", "lng", *_FEATURE_FIELDS.values()]
+
+
+def _columns(candidates: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    # One pass over the candidates; None becomes NaN and booleans 0/1
+    matrix = np.array([[c.get(name) for name in _COLUMNS] for c in candidates], dtype=np.float64)
+    return dict(zip(_COLUMNS, matrix.T))
+
+
+def _range_penalty(values: np.ndarray, bounds: Dict[str, Any]) -> np.ndarray:
+    # Relative distance outside [min, max] capped at 1, 0 inside
+    penalty = np.zeros_like(values)
+    low, high = bounds.get("min"), bounds.get("max")
+    if high:
+        penalty += np.maximum(values - high, 0) / high
+    if low:
+        penalty += np.maximum(low - values, 0) / low
+    return np.minimum(penalty, 1.0)
+
+
+def preference_scores(
+    candidates: List[Dict[str, Any]],
+    preferences: Dict[str, Any],
+    weights: RerankWeights,
+) -> np.ndarray:
+    """Score each candidate against update_preferences-shaped preferences; higher is better.
+
+    Every term is in [-1, 1] and missing listing values (NaN) contribute nothing.
+    """
+    columns = _columns(candidates)
+    similarity = columns["@search.score"]
+    if np.isnan(similarity).all():
+        # No scores at all (e.g. results from a fallback); let the preferences decide
+        similarity = np.zeros(len(candidates))
+    similarity = np.where(np.isnan(similarity), np.nanmin(similarity), similarity)
+    spread = similarity.max() - similarity.min()
+    terms = [(similarity - similarity.min()) / spread if spread else np.zeros(len(candidates))]
+    term_weights = [weights.similarity]
+
+    if preferences.get("budget"):
+        terms.append(-_range_penalty(columns["price"], preferences["budget"]))
+        term_weights.append(weights.price)
+    if preferences.get("size"):
+        terms.append(-_range_penalty(columns["size"], preferences["size"]))
+        term_weights.append(weights.size)
+    if preferences.get("rooms"):
+        wanted = float(preferences["rooms"])
+        terms.append(-np.minimum(np.abs(columns["rooms"] - wanted) / wanted, 1.0))
+        term_weights.append(weights.rooms)
+
+    wanted_features = {
+        _FEATURE_FIELDS[name]: bool(value)
+        for name, value in (preferences.get("features") or {}).items()
+        if name in _FEATURE_FIELDS and value is not None
+    }
+    if wanted_features:
+        # +1 per agreeing feature, -1 per disagreeing one, averaged over the known ones
+        have = np.stack([columns[field] for field in wanted_features])
+        want = np.array([[1.0 if v else 0.0] for v in wanted_features.values()])
+        agreement = np.where(np.isnan(have), np.nan, np.where(have == want, 1.0, -1.0))
+        known = (~np.isnan(have)).sum(axis=0)
+        terms.append(np.where(known > 0, np.nansum(agreement, axis=0) / np.maximum(known, 1), np.nan))
+        term_weights.append(weights.features)
+
+    location = (preferences.get("location") or "").strip().lower()
+    if location and weights.geo:
+        lat, lng = columns["lat"], columns["lng"]
+        in_area = np.array([location in str(c.get("location") or "").lower() for c in candidates])
+        in_area &= ~(np.isnan(lat) | np.isnan(lng))
+        if in_area.any():
+            # Distance to the centre of the candidates in the preferred area, 0 at 0 km, -1 at 10 km or more
+            center_lat, center_lng = np.radians(lat[in_area].mean()), np.radians(lng[in_area].mean())
+            phi, lam = np.radians(lat), np.radians(lng)
+            a = (np.sin((phi - center_lat) / 2) ** 2
+                 + np.cos(phi) * np.cos(center_lat) * np.sin((lam - center_lng) / 2) ** 2)
+            distance = 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            terms.append(-np.minimum(distance / 10.0, 1.0))
+            term_weights.append(weights.geo)
+
+    return np.nansum(np.array(term_weights)[:, None] * np.stack(terms), axis=0)
+
+
+def rerank(
+    candidates: List[Dict[str, Any]],
+    preferences: Optional[Dict[str, Any]],
+    k: int = 5,
+    weights: Optional[RerankWeights] = None,
+) -> List[Dict[str, Any]]:
+    """The k candidates that best combine vector similarity and fit with the preferences."""
+    if len(candidates) <= 1 or not preferences:
+        return candidates[:k]
+    scores = preference_scores(candidates, preferences, weights or RerankWeights())
+    top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+    return [candidates[i] for i in top[np.argsort(-scores[top], kind="stable")]]
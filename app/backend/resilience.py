@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Hedger:
+    """Issues a second, identical request when the first one outlives the recent p95.
+
+    Whichever request finishes first (successfully) wins and the other is cancelled,
+    which trims the latency tail at the cost of roughly (1 - percentile) extra load.
+    """
+
+    def __init__(self, percentile: float = 0.95, window: int = 200, min_samples: int = 20):
+        self.percentile = percentile
+        self.latency = LatencyTracker(window, min_samples)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        threshold = self.latency.percentile(self.percentile)
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+            "hedge_after_seconds": round(threshold, 4) if threshold is not None else None,
+        }
+
+    async def _timed(self, factory: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await factory()
+        self.latency.observe(time.perf_counter() - start)
+        return result
+
+    async def call(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        hedge: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """Await factory(), hedged with hedge() (default: factory again) when it runs long."""
+        self.calls += 1
+        primary = asyncio.create_task(self._timed(factory))
+        pending = {primary}
+        try:
+            threshold = self.latency.percentile(self.percentile)
+            if threshold is not None:
+                done, _ = await asyncio.wait(pending, timeout=threshold)
+                if not done:
+                    self.hedged += 1
+                    pending.add(asyncio.create_task(self._timed(hedge or factory)))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also runs when the caller is cancelled, e.g. by a tool deadline
+            for task in pending:
+                task.cancel()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one in-flight call.
+
+    The first caller for a key starts the call; callers arriving while it runs wait
+    for the same result (or exception). A cancelled caller only stops waiting: the
+    shared call keeps going for the others and is only cancelled once nobody waits
+    for it any more. Finished calls are forgotten, so this never serves stale results.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._flights),
+            "abandoned": self.abandoned,
+        }
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up; don't let a late arrival join a call being cancelled
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
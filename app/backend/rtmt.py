@@ -1,6 +1,9 @@
 import asyncio
+import base64
 import json
 import logging
+import time
+from contextvars import ContextVar
 from enum import Enum
 from typing import Any, Callable, Optional
 
@@ -9,8 +12,16 @@ from aiohttp import web
 from azure.core.credentials import AzureKeyCredential
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 
+from audio import SAMPLE_RATE, AudioSavings, DownstreamEncoder, SilenceTrimmer
+from realtime_router import RealtimeRouter, RealtimeTarget
+from tool_executors import ToolExecutionMode, ToolExecutors
+
 logger = logging.getLogger("voicerag")
 
+# Per-connection state tools can share, e.g. the preferences gathered so far; each
+# realtime session gets its own dict, inline tool targets see the current one
+session_state: ContextVar[dict] = ContextVar("session_state")
+
 class ToolResultDirection(Enum):
     TO_SERVER = 1
     TO_CLIENT = 2
@@ -18,23 +29,62 @@ class ToolResultDirection(Enum):
 class ToolResult:
     text: str
     destination: ToolResultDirection
+    # Set when the result came from a fallback rather than the tool itself
+    degraded: bool
+    # Why the fallback answered: "timeout" or "error"
+    degraded_reason: Optional[str]
 
-    def __init__(self, text: str, destination: ToolResultDirection):
+    def __init__(self, text: str, destination: ToolResultDirection, degraded: bool = False,
+                 degraded_reason: Optional[str] = None):
         self.text = text
         self.destination = destination
+        self.degraded = degraded
+        self.degraded_reason = degraded_reason
 
     def to_text(self) -> str:
         if self.text is None:
             return ""
-        return self.text if type(self.text) == str else json.dumps(self.text)
+        if type(self.text) == str:
+            return self.text
+        if self.degraded and isinstance(self.text, dict):
+            return json.dumps({**self.text, "degraded": True})
+        return json.dumps(self.text)
 
 class Tool:
     target: Callable[..., ToolResult]
     schema: Any
+    # Seconds the tool may take before the fallback (if any) answers instead
+    deadline: Optional[float]
+    fallback: Optional[Callable[..., ToolResult]]
+    # INLINE targets are async; THREAD and PROCESS targets are plain functions returning a ToolResult
+    mode: ToolExecutionMode
 
-    def __init__(self, target: Any, schema: Any):
+    def __init__(self, target: Any, schema: Any, deadline: Optional[float] = None, fallback: Any = None,
+                 extra_metrics: Optional[Callable[[], dict]] = None, mode: ToolExecutionMode = ToolExecutionMode.INLINE):
         self.target = target
         self.schema = schema
+        self.mode = mode
+        self.deadline = deadline
+        self.fallback = fallback
+        self.extra_metrics = extra_metrics
+        self.calls = 0
+        self.deadline_misses = 0
+        self.failures = 0
+        self.degraded = 0
+        self.error_fallbacks = 0
+
+    @property
+    def metrics(self) -> dict:
+        metrics = {
+            "calls": self.calls,
+            "deadline_misses": self.deadline_misses,
+            "failures": self.failures,
+            "degraded": self.degraded,
+            "error_fallbacks": self.error_fallbacks,
+        }
+        if self.extra_metrics is not None:
+            metrics.update(self.extra_metrics())
+        return metrics
 
 class RTToolCall:
     tool_call_id: str
@@ -63,15 +113,71 @@ class RTMiddleTier:
     api_version: str = "2024-10-01-preview"
     _tools_pending = {}
     _token_provider = None
+    executors: ToolExecutors
+    # Optional AdmissionController; without one every session is accepted
+    admission = None
+    router: RealtimeRouter
+    # Seconds to wait for an upstream handshake before failing over to the next target
+    connect_timeout: float = 10.0
+    # Drop long silences from inbound audio before it goes upstream
+    trim_silence: bool = False
 
-    def __init__(self, endpoint: str, deployment: str, credentials: AzureKeyCredential | DefaultAzureCredential):
+    def __init__(self, endpoint: str, deployment: str, credentials: AzureKeyCredential | DefaultAzureCredential,
+                 targets: Optional[list[RealtimeTarget]] = None):
         self.endpoint = endpoint
         self.deployment = deployment
+        # Without a pool, endpoint/deployment is the only target
+        self.router = RealtimeRouter(targets or [RealtimeTarget(endpoint, deployment)])
+        self.executors = ToolExecutors()
+        self.silence_savings = AudioSavings()
+        self.downstream_savings = AudioSavings()
         if isinstance(credentials, AzureKeyCredential):
             self.key = credentials.key
         else:
             self._token_provider = get_bearer_token_provider(credentials, "https://cognitiveservices.azure.com/.default")
-            self._token_provider() # Warm up
+
+    async def warm_up(self):
+        # Fetch the first token off the event loop so a slow identity endpoint doesn't block worker boot
+        if self._token_provider is not None:
+            await asyncio.to_thread(self._token_provider)
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "tools": {name: tool.metrics for name, tool in self.tools.items()},
+            "executors": self.executors.metrics,
+            "silence_trimming": self.silence_savings.metrics,
+            "client_audio_transcoding": self.downstream_savings.metrics,
+        }
+
+    async def _run_tool(self, name: str, tool: Tool, args: Any) -> ToolResult:
+        tool.calls += 1
+        try:
+            call = self.executors.run(tool.mode, tool.target, args)
+            if tool.deadline is None:
+                return await call
+            return await asyncio.wait_for(call, tool.deadline)
+        except asyncio.TimeoutError:
+            tool.deadline_misses += 1
+            logger.warning("Tool '%s' missed its %.2fs deadline", name, tool.deadline)
+            if tool.fallback is None:
+                tool.degraded += 1
+                return ToolResult({"error": f"{name} timed out"}, ToolResultDirection.TO_SERVER,
+                                  degraded=True, degraded_reason="timeout")
+            reason = "timeout"
+        except Exception:
+            tool.failures += 1
+            if tool.fallback is None:
+                raise
+            logger.exception("Tool '%s' failed, using its fallback", name)
+            tool.error_fallbacks += 1
+            reason = "error"
+
+        tool.degraded += 1
+        result = await tool.fallback(args)
+        result.degraded = True
+        result.degraded_reason = reason
+        return result
 
     async def _process_message_to_client(self, msg: str, client_ws: web.WebSocketResponse, server_ws: web.WebSocketResponse) -> Optional[str]:
         message = json.loads(msg.data)
@@ -87,6 +193,12 @@ class RTMiddleTier:
                     session["max_response_output_tokens"] = None
                     updated_message = json.dumps(message)
 
+                case "response.audio.delta":
+                    encoder = session_state.get({}).get("downstream_encoder")
+                    if encoder is not None:
+                        message["delta"] = base64.b64encode(encoder.encode(base64.b64decode(message["delta"]))).decode("ascii")
+                        updated_message = json.dumps(message)
+
                 case "response.output_item.added":
                     if "item" in message and message["item"]["type"] == "function_call":
                         updated_message = None
@@ -113,14 +225,19 @@ class RTMiddleTier:
                         tool = self.tools[item["name"]]
                         args = item["arguments"]
                        
-                        result = await tool.target(json.loads(args))
+                        result = await self._run_tool(item["name"], tool, json.loads(args))
                         
+                        output = "Here is the result as returned from the search tool, read them as they are" + result.to_text() # if result.destination == ToolResultDirection.TO_SERVER else ""
+                        if result.degraded_reason == "error":
+                            output = "Note: the tool failed, so these are degraded results from a cache or local fallback. " + output
+                        elif result.degraded:
+                            output = "Note: the tool was too slow, so these are degraded results from a cache or local fallback. " + output
                         await server_ws.send_json({
                             "type": "conversation.item.create",
                             "item": {
                                 "type": "function_call_output",
                                 "call_id": item["call_id"],
-                                "output": "Here is the result as returned from the search tool, read them as they are" + result.to_text() # if result.destination == ToolResultDirection.TO_SERVER else ""
+                                "output": output
                             }
                         })
                         if result.destination == ToolResultDirection.TO_CLIENT:
@@ -176,55 +293,181 @@ class RTMiddleTier:
                     
                     session["tool_choice"] = "auto" if len(self.tools) > 0 else "none"
                     session["tools"] = [tool.schema for tool in self.tools.values()]
+                    if (trimmer := session_state.get({}).get("silence_trimmer")) is not None:
+                        trimmer.configure(session)
+                    # Middle-tier only option, never forwarded upstream
+                    if (requested := session.pop("client_output_audio", None)) is not None:
+                        await self._negotiate_client_audio(requested, session, ws)
+                    elif session.get("output_audio_format", "pcm16") != "pcm16":
+                        # Only pcm16 can be transcoded; anything else goes to the client as is
+                        session_state.get({})["downstream_encoder"] = None
                     updated_message = json.dumps(message)
 
+                case "input_audio_buffer.append":
+                    trimmer = session_state.get({}).get("silence_trimmer")
+                    if trimmer is not None and trimmer.enabled:
+                        audio = base64.b64decode(message["audio"])
+                        trimmed = trimmer.process(audio)
+                        if not trimmed:
+                            updated_message = None
+                        elif len(trimmed) != len(audio):
+                            message["audio"] = base64.b64encode(trimmed).decode("ascii")
+                            updated_message = json.dumps(message)
+
+                case "input_audio_buffer.clear":
+                    if (trimmer := session_state.get({}).get("silence_trimmer")) is not None:
+                        trimmer.reset()
+
         return updated_message
 
-    async def _forward_messages(self, ws: web.WebSocketResponse):
-        async with aiohttp.ClientSession(base_url=self.endpoint) as session:
-            params = { "api-version": self.api_version, "deployment": self.deployment}
-            headers = {}
+    async def _negotiate_client_audio(self, requested: Any, session: dict, ws: web.WebSocketResponse):
+        # Clients on slow links can ask for compact response audio, e.g.
+        # {"format": "g711_ulaw", "sample_rate": 8000}; the reply says what they will get
+        state = session_state.get({})
+        reply = {"type": "extension.client_output_audio", "format": "pcm16", "sample_rate": SAMPLE_RATE}
+        try:
+            if session.get("output_audio_format", "pcm16") != "pcm16":
+                raise ValueError("client_output_audio needs pcm16 output_audio_format upstream")
+            encoder = DownstreamEncoder(requested.get("format", "pcm16"), int(requested.get("sample_rate", SAMPLE_RATE)))
+        except (AttributeError, TypeError, ValueError) as e:
+            state["downstream_encoder"] = None
+            reply["error"] = str(e)
+        else:
+            state["downstream_encoder"] = None if encoder.passthrough else encoder
+            state.setdefault("downstream_encoders", []).append(encoder)
+            reply.update(format=encoder.format, sample_rate=encoder.sample_rate)
+        await ws.send_json(reply)
+
+    def _record_audio_savings(self, state: dict):
+        if (trimmer := state.get("silence_trimmer")) is not None and trimmer.bytes_in:
+            self.silence_savings.record(trimmer.bytes_in, trimmer.bytes_saved, trimmer.cpu_seconds)
+            logger.info("Silence trimming saved %d of %d inbound audio bytes this session",
+                        trimmer.bytes_saved, trimmer.bytes_in)
+        encoders = [e for e in state.get("downstream_encoders", []) if e.bytes_in]
+        if encoders:
+            bytes_in = sum(e.bytes_in for e in encoders)
+            bytes_saved = bytes_in - sum(e.bytes_out for e in encoders)
+            self.downstream_savings.record(bytes_in, bytes_saved, sum(e.cpu_seconds for e in encoders))
+            logger.info("Client audio transcoding saved %d of %d response audio bytes this session",
+                        bytes_saved, bytes_in)
+
+    async def _auth_headers(self, target: RealtimeTarget) -> dict:
+        if target.key is not None:
+            return { "api-key": target.key }
+        if self.key is not None:
+            return { "api-key": self.key }
+        # No async version of the token provider; it caches, but refreshes can still block
+        return { "Authorization": f"Bearer {await asyncio.to_thread(self._token_provider)}" }
+
+    async def _connect_upstream(self, session: aiohttp.ClientSession, ws: web.WebSocketResponse) -> Optional[tuple[RealtimeTarget, aiohttp.ClientWebSocketResponse]]:
+        # Try the targets best first, failing over to the next one when a handshake fails
+        status = None
+        for attempt, target in enumerate(self.router.order()):
+            if attempt > 0:
+                self.router.failovers += 1
+            params = { "api-version": self.api_version, "deployment": target.deployment}
+            headers = await self._auth_headers(target)
             if "x-ms-client-request-id" in ws.headers:
                 headers["x-ms-client-request-id"] = ws.headers["x-ms-client-request-id"]
-            if self.key is not None:
-                headers = { "api-key": self.key }
-            else:
-                headers = { "Authorization": f"Bearer {self._token_provider()}" } # NOTE: no async version of token provider, maybe refresh token on a timer?
-            async with session.ws_connect("/openai/realtime", headers=headers, params=params) as target_ws:
-                async def from_client_to_server():
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_server(msg, ws)
-                            if new_msg is not None:
-                                await target_ws.send_str(new_msg)
-                        else:
-                            print("Error: unexpected message type:", msg.type)
+            started = time.perf_counter()
+            try:
+                target_ws = await asyncio.wait_for(
+                    session.ws_connect(f"{target.endpoint}/openai/realtime", headers=headers, params=params),
+                    self.connect_timeout
+                )
+            except aiohttp.WSServerHandshakeError as e:
+                status = e.status
+                if self.admission is not None:
+                    self.admission.record_upstream(throttled=e.status == 429)
+                if e.status == 429:
+                    self.router.record_throttled(target)
+                else:
+                    self.router.record_failure(target)
+                logger.warning("Realtime upstream %s refused the connection: %s", target.name, e.status)
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                self.router.record_failure(target)
+                logger.warning("Could not connect to realtime upstream %s: %r", target.name, e)
+                continue
+            self.router.record_connect(target, time.perf_counter() - started)
+            if self.admission is not None:
+                self.admission.record_upstream(throttled=False)
+            return target, target_ws
+
+        await ws.send_json({"type": "error", "error": {"code": "upstream_unavailable", "status": status}})
+        return None
+
+    async def _forward_messages(self, ws: web.WebSocketResponse):
+        session_state.set({})
+        if self.trim_silence:
+            session_state.get()["silence_trimmer"] = SilenceTrimmer()
+        try:
+            await self._connect_and_relay(ws)
+        finally:
+            self._record_audio_savings(session_state.get())
+
+    async def _connect_and_relay(self, ws: web.WebSocketResponse):
+        async with aiohttp.ClientSession() as session:
+            upstream = await self._connect_upstream(session, ws)
+            if upstream is None:
+                return
+            target, target_ws = upstream
+            target.active += 1
+            try:
+                await self._relay(ws, target_ws)
+            finally:
+                target.active -= 1
+
+    async def _relay(self, ws: web.WebSocketResponse, target_ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async def from_client_to_server():
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        new_msg = await self._process_message_to_server(msg, ws)
+                        if new_msg is not None:
+                            await target_ws.send_str(new_msg)
+                    else:
+                        print("Error: unexpected message type:", msg.type)
+                
+                # Means it is gracefully closed by the client then time to close the target_ws
+                if target_ws:
+                    print("Closing OpenAI's realtime socket connection.")
+                    await target_ws.close()
                     
-                    # Means it is gracefully closed by the client then time to close the target_ws
-                    if target_ws:
-                        print("Closing OpenAI's realtime socket connection.")
-                        await target_ws.close()
-                        
-                async def from_server_to_client():
-                    async for msg in target_ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_client(msg, ws, target_ws)
-                            if new_msg is not None:
-                                await ws.send_str(new_msg)
-                        else:
-                            print("Error: unexpected message type:", msg.type)
-
-                try:
-                    await asyncio.gather(from_client_to_server(), from_server_to_client())
-                except ConnectionResetError:
-                    # Ignore the errors resulting from the client disconnecting the socket
-                    pass
+            async def from_server_to_client():
+                async for msg in target_ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        new_msg = await self._process_message_to_client(msg, ws, target_ws)
+                        if new_msg is not None:
+                            await ws.send_str(new_msg)
+                    else:
+                        print("Error: unexpected message type:", msg.type)
+
+            try:
+                await asyncio.gather(from_client_to_server(), from_server_to_client())
+            except ConnectionResetError:
+                # Ignore the errors resulting from the client disconnecting the socket
+                pass
+        finally:
+            await target_ws.close()
 
     async def _websocket_handler(self, request: web.Request):
         ws = web.WebSocketResponse()
         await ws.prepare(request)
-        await self._forward_messages(ws)
+        if self.admission is None:
+            await self._forward_messages(ws)
+            return ws
+        if not await self.admission.acquire(ws):
+            return ws
+        try:
+            await self._forward_messages(ws)
+        finally:
+            self.admission.release()
         return ws
     
+    async def _on_cleanup(self, app):
+        self.executors.shutdown()
+
     def attach_to_app(self, app, path):
-        app.router.add_get(path, self._websocket_handler)
\ No newline at end of file
+        app.router.add_get(path, self._websocket_handler)
+        app.on_cleanup.append(self._on_cleanup)
\ No newline at end of file
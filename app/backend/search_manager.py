@@ -1,15 +1,61 @@
 import os
 import dotenv
 import asyncio
-from typing import List, Dict, Any, Optional
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
-from openai import AzureOpenAI
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
 from azure.search.documents.models import VectorizedQuery
 
+from embedders import Embedder, EmbedderMismatchError, check_index_embedder, create_embedder
+from resilience import SingleFlight
+from vector_compression import EMBEDDING_DIMENSIONS, VECTOR_COMPRESSION, VECTOR_OVERSAMPLING
+
 dotenv.load_dotenv(override=True)
 
+logger = logging.getLogger("voicerag")
+
+# Stored listing fields, i.e. everything except the embedding vector
+LISTING_FIELDS = [
+    "id", "title", "description", "location", "contact", "price", "rooms", "size", "floor",
+    "built_year", "furnished", "availability", "pets_allowed", "lat", "lng", "elevator",
+    "balcony", "smoking_allowed", "deposit",
+]
+
+# update_preferences features that exist as fields in the index; the rest can't be filtered on
+_FEATURE_FIELDS = {"balcony": "balcony", "elevator": "elevator", "furnished": "furnished", "pets": "pets_allowed"}
+
+
+def _odata_string(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def preferences_filter(preferences: Dict[str, Any]) -> Optional[str]:
+    """OData filter for a dict shaped like the update_preferences tool arguments."""
+    filters = []
+    budget = preferences.get("budget") or {}
+    if budget.get("min") is not None:
+        filters.append(f"price ge {float(budget['min'])}")
+    if budget.get("max") is not None:
+        filters.append(f"price le {float(budget['max'])}")
+    size = preferences.get("size") or {}
+    if size.get("min") is not None:
+        filters.append(f"size ge {int(size['min'])}")
+    if size.get("max") is not None:
+        filters.append(f"size le {int(size['max'])}")
+    if preferences.get("rooms") is not None:
+        filters.append(f"rooms ge {int(preferences['rooms'])}")
+    if preferences.get("location"):
+        filters.append(f"search.in(location, '{_odata_string(preferences['location'])}', ',')")
+    for feature, wanted in (preferences.get("features") or {}).items():
+        if feature in _FEATURE_FIELDS and wanted is not None:
+            filters.append(f"{_FEATURE_FIELDS[feature]} eq {str(bool(wanted)).lower()}")
+    return " and ".join(filters) if filters else None
+
+
 class SearchManager:
     def __init__(
         self,
@@ -17,9 +63,29 @@ class SearchManager:
         api_key: str,
         index_name: str,
         embedding_model: str,
+        embedding_dimensions: int = EMBEDDING_DIMENSIONS,
+        vector_compression: str = VECTOR_COMPRESSION,
+        oversampling: float = VECTOR_OVERSAMPLING,
+        embedding_cache: Optional[Any] = None,
+        embedder: Optional[Embedder] = None,
     ):
         self.index_name = index_name
         self.embedding_model = embedding_model
+        self.embedder = embedder or create_embedder(model=embedding_model, dimensions=embedding_dimensions)
+        self.embedding_dimensions = self.embedder.dimensions
+        # Oversampling is only accepted by the service when the field is compressed
+        self.oversampling = oversampling if vector_compression != "none" else None
+        # Optional get(text)/put(text, vector) cache, e.g. a SharedEmbeddingCache shared by all workers
+        self.embedding_cache = embedding_cache
+        # Runs blocking calls (the embedder) as run_blocking(target, arg); the middle tier
+        # points this at its bounded tool thread pool
+        self.run_blocking: Callable[[Callable[[Any], Any], Any], Awaitable[Any]] = asyncio.to_thread
+        # Whether search pages can be ordered by id; turned off for indexes where it isn't sortable
+        self.sortable_id = True
+        # Set by warm_up when the index was built with another embedder; vector search is refused then
+        self.embedder_mismatch: Optional[EmbedderMismatchError] = None
+        # Concurrent identical embedding and search calls share one upstream request
+        self.single_flight = SingleFlight()
         self.azure_search_endpoint = f"https://{service_name}.search.windows.net"
         self.azure_search_credential = AzureKeyCredential(api_key)
 
@@ -29,33 +95,176 @@ class SearchManager:
             credential=self.azure_search_credential
         )
 
-        self.azure_openai_client = AzureOpenAI(
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY")
-        )
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return self.single_flight.metrics
+
+    async def current_index(self) -> str:
+        """The concrete index queries go to: the alias target if index_name is an alias.
+
+        Reading aliases needs an admin key; with a query key this is just index_name.
+        """
+        async with SearchIndexClient(self.azure_search_endpoint, self.azure_search_credential) as index_client:
+            try:
+                return (await index_client.get_alias(self.index_name)).indexes[0]
+            except ResourceNotFoundError:
+                return self.index_name
+            except HttpResponseError as e:
+                if e.status_code not in (401, 403):
+                    raise
+                return self.index_name
+
+    async def warm_up(self):
+        # Load the embedder's client or model, and refuse to serve queries against an
+        # index whose vectors came from a different embedder
+        await asyncio.to_thread(self.embedder.warm_up)
+        async with SearchIndexClient(self.azure_search_endpoint, self.azure_search_credential) as index_client:
+            try:
+                index = await index_client.get_index(await self.current_index())
+            except HttpResponseError as e:
+                if e.status_code not in (401, 403):
+                    raise
+                # Serving deployments usually only have a query key, which can't read index definitions
+                logger.warning("Can't read the definition of index %s (%s), skipping the embedder check",
+                               self.index_name, e.status_code)
+                return
+            try:
+                check_index_embedder(index, self.embedder)
+            except EmbedderMismatchError as e:
+                self.embedder_mismatch = e
+                raise
+            self.embedder_mismatch = None
 
     def _calculate_embedding(self, text: str) -> List[float]:
-        response = self.azure_openai_client.embeddings.create(input=text, model=self.embedding_model)
-        return response.data[0].embedding
+        if self.embedding_cache is not None and (cached := self.embedding_cache.get(text)) is not None:
+            return cached
+        embedding = self.embedder.embed_one(text)
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(text, embedding)
+        return embedding
+
+    async def _embed_query(self, text: str) -> List[float]:
+        return await self.single_flight.do(("embed", text), lambda: self.run_blocking(self._calculate_embedding, text))
+
+    async def search_by_embedding(self, query: str, k: int = 3, coalesce: bool = True) -> List[Dict[str, Any]]:
+        """Top-k listings for a query. Results may be shared with concurrent callers; don't mutate them.
+
+        coalesce=False always issues a new search (still sharing the embedding), e.g. for hedged requests.
+        """
+        if not coalesce:
+            return await self._search_by_embedding(query, k)
+        return await self.single_flight.do(("vector", query, k), lambda: self._search_by_embedding(query, k))
 
-    async def search_by_embedding(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        query_embedding = self._calculate_embedding(query)
+    async def _search_by_embedding(self, query: str, k: int) -> List[Dict[str, Any]]:
+        if self.embedder_mismatch is not None:
+            # Neighbours of a vector from another embedder are meaningless; callers fall back instead
+            raise self.embedder_mismatch
+        query_embedding = await self._embed_query(query)
         vector_query = VectorizedQuery(
             kind="vector",
             vector=query_embedding,
             fields="embedding",
             k_nearest_neighbors=k,
-            exhaustive=False
+            exhaustive=False,
+            oversampling=self.oversampling
         )
 
-        results = await self.search_client.search(vector_queries=[vector_query])
+        results = await self.search_client.search(vector_queries=[vector_query], select=LISTING_FIELDS, top=k)
         output = []
         async for page in results.by_page():
             async for doc in page:
                 output.append(doc)
         return output
 
+    async def get_listings_by_ids(self, ids: List[str]) -> List[Dict[str, Any]]:
+        # One filtered query instead of a get_document round trip per id; ids must be
+        # valid document keys (letters, digits, '_', '-', '=') so they can't break the filter
+        if not ids:
+            return []
+        return await self.single_flight.do(("ids", tuple(ids)), lambda: self._get_listings_by_ids(ids))
+
+    async def _get_listings_by_ids(self, ids: List[str]) -> List[Dict[str, Any]]:
+        results = await self.search_client.search(
+            search_text="*",
+            filter=f"search.in(id, '{','.join(ids)}', ',')",
+            select=LISTING_FIELDS,
+            top=len(ids)
+        )
+        output = []
+        async for page in results.by_page():
+            async for doc in page:
+                output.append({field: doc.get(field) for field in LISTING_FIELDS})
+        return output
+
+    async def search_page(
+        self,
+        filter_str: Optional[str],
+        skip: int,
+        top: int,
+        include_total_count: bool = False
+    ) -> tuple[List[Dict[str, Any]], Optional[int]]:
+        """One page of filtered listings (no embeddings) and, if requested, the total match count."""
+        return await self.single_flight.do(
+            ("page", filter_str, skip, top, include_total_count),
+            lambda: self._search_page(filter_str, skip, top, include_total_count),
+        )
+
+    async def _search_page(
+        self,
+        filter_str: Optional[str],
+        skip: int,
+        top: int,
+        include_total_count: bool
+    ) -> tuple[List[Dict[str, Any]], Optional[int]]:
+        # All "*" matches score the same, so only an explicit order keeps $skip pages from
+        # overlapping or missing listings between requests
+        order_by = ["id"] if self.sortable_id else None
+        try:
+            results = await self.search_client.search(
+                search_text="*",
+                filter=filter_str,
+                select=LISTING_FIELDS,
+                skip=skip,
+                top=top,
+                order_by=order_by,
+                include_total_count=include_total_count
+            )
+            docs = [{field: doc.get(field) for field in LISTING_FIELDS} async for doc in results]
+        except HttpResponseError as e:
+            if order_by is None or e.status_code != 400:
+                raise
+            # Indexes built before id was sortable; rebuild them to get stable pages
+            logger.warning("Index %s can't sort by id, search pages may shift between requests: %s",
+                           self.index_name, e.message)
+            self.sortable_id = False
+            return await self._search_page(filter_str, skip, top, include_total_count)
+        total = await results.get_count() if include_total_count else None
+        return docs, total
+
+    async def facet_counts(
+        self,
+        filter_str: Optional[str],
+        facets: List[str]
+    ) -> tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        """Match count and facet buckets for a filter, without returning any documents."""
+        return await self.single_flight.do(
+            ("facets", filter_str, tuple(facets)), lambda: self._facet_counts(filter_str, facets)
+        )
+
+    async def _facet_counts(
+        self,
+        filter_str: Optional[str],
+        facets: List[str]
+    ) -> tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        results = await self.search_client.search(
+            search_text="*",
+            filter=filter_str,
+            facets=facets,
+            top=0,
+            include_total_count=True
+        )
+        return await results.get_count(), await results.get_facets() or {}
+
     async def search_by_filters(
         self,
         location: Optional[str] = None,
@@ -98,7 +307,19 @@ class SearchManager:
         location: Optional[str] = None,
         max_price: Optional[float] = None
     ) -> List[Dict[str, Any]]:
-        query_embedding = self._calculate_embedding(text_query)
+        return await self.single_flight.do(
+            ("vector_filters", text_query, k, location, max_price),
+            lambda: self._search_with_vector_and_filters(text_query, k, location, max_price),
+        )
+
+    async def _search_with_vector_and_filters(
+        self,
+        text_query: str,
+        k: int,
+        location: Optional[str],
+        max_price: Optional[float]
+    ) -> List[Dict[str, Any]]:
+        query_embedding = await self._embed_query(text_query)
         # Construct OData filter string
         filters = []
         if location:
@@ -113,11 +334,12 @@ class SearchManager:
             vector=query_embedding,
             fields="embedding",
             k_nearest_neighbors=k,
+            oversampling=self.oversampling,
             filter=filter_str,
             vector_filter_mode="pre"  # or "post" depending on your requirement
         )
 
-        results = await self.search_client.search(vector_queries=[vector_query])
+        results = await self.search_client.search(vector_queries=[vector_query], select=LISTING_FIELDS, top=k)
         output = []
         async for page in results.by_page():
             async for doc in page:
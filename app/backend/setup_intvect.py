@@ -1,14 +1,19 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import subprocess
 
-from azure.core.exceptions import ResourceExistsError
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 
 
 from azure.identity import AzureDeveloperCliCredential
+from azure.identity.aio import AzureDeveloperCliCredential as AsyncAzureDeveloperCliCredential
 from azure.search.documents import SearchClient
-from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
+from azure.search.documents.indexes import SearchIndexClient
+from azure.search.documents.indexes import SearchIndexerClient as SyncSearchIndexerClient
+from azure.search.documents.indexes.aio import SearchIndexerClient
 from azure.search.documents.indexes.models import (
     AzureOpenAIEmbeddingSkill,
     AzureOpenAIParameters,
@@ -41,10 +46,15 @@ from azure.search.documents.indexes.models import (
     VectorSearchAlgorithmMetric,
     VectorSearchProfile,
 )
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
 from dotenv import load_dotenv
 from rich.logging import RichHandler
 
+from dedup import NearDuplicateDetector
+from ingest import write_json_array
+from vector_compression import compression_configuration
+
 FLAT_DATA = [
     {
         "id": "1",
@@ -76,9 +86,9 @@ def load_azd_env():
     load_dotenv(env_file_path, override=True)
 
 
-def setup_index(azure_credential, index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions):
+def setup_index(azure_credential, index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions, vector_compression="none"):
     index_client = SearchIndexClient(azure_search_endpoint, azure_credential)
-    indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
+    indexer_client = SyncSearchIndexerClient(azure_search_endpoint, azure_credential)
 
     # Create data source connection if not exists
     data_source_connections = indexer_client.get_data_source_connections()
@@ -105,7 +115,7 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
     else:
         logger.info(f"Creating index: {index_name}")
         fields = [
-            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+            SimpleField(name="id", type=SearchFieldDataType.String, key=True, sortable=True),
             SearchableField(name="title", type=SearchFieldDataType.String),
             SearchableField(name="description", type=SearchFieldDataType.String),
             SimpleField(name="location", type=SearchFieldDataType.String, filterable=True, facetable=True),
@@ -133,6 +143,8 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
             )
         ]
 
+        compression = compression_configuration(vector_compression, name="vc")
+
         index = SearchIndex(
             name=index_name,
             fields=fields,
@@ -142,8 +154,10 @@ def setup_index(azure_credential, index_name, azure_search_endpoint, azure_stora
                 ],
                 vectorizers=vectorizers,
                 profiles=[
-                    VectorSearchProfile(name="vp", algorithm_configuration_name="algo", vectorizer="openai_vectorizer")
-                ]
+                    VectorSearchProfile(name="vp", algorithm_configuration_name="algo", vectorizer="openai_vectorizer",
+                                        compression_configuration_name=(compression.name if compression else None))
+                ],
+                compressions=([compression] if compression else None)
             )
         )
         index_client.create_index(index)
@@ -197,44 +211,87 @@ def upload_flat_data(azure_search_endpoint, azure_credential, index_name, data):
         logger.error(f"Error uploading documents: {str(e)}")
 
 
-def upload_documents(azure_credential, indexer_name, azure_search_endpoint, azure_storage_endpoint, azure_storage_container):
-    indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
-    # Upload the documents in /data folder to the blob storage container
-    blob_client = BlobServiceClient(
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            md5.update(chunk)
+    return md5.digest()
+
+
+async def _upload_if_changed(container_client, path, semaphore):
+    filename = os.path.basename(path)
+    async with semaphore:
+        local_md5 = await asyncio.to_thread(_file_md5, path)
+        blob_client = container_client.get_blob_client(filename)
+        try:
+            properties = await blob_client.get_blob_properties()
+            remote_md5 = properties.content_settings.content_md5
+        except ResourceNotFoundError:
+            remote_md5 = None
+        if remote_md5 is not None and bytes(remote_md5) == local_md5:
+            logger.info("Blob content unchanged, skipping file: %s", filename)
+            return False
+
+        logger.info("Uploading blob for file: %s", filename)
+        with open(path, "rb") as opened_file:
+            # Blobs above max_single_put_size are sent as blocks in parallel; the service
+            # doesn't compute an MD5 for those, so store the whole-file hash explicitly.
+            await blob_client.upload_blob(
+                opened_file,
+                overwrite=True,
+                max_concurrency=4,
+                content_settings=ContentSettings(content_md5=bytearray(local_md5)),
+            )
+        return True
+
+
+async def upload_documents(azure_credential, indexer_name, azure_search_endpoint, azure_storage_endpoint, azure_storage_container, max_concurrency=8):
+    # Upload the documents in /data folder to the blob storage container, skipping unchanged content
+    async with BlobServiceClient(
         account_url=azure_storage_endpoint, credential=azure_credential,
-        max_single_put_size=4 * 1024 * 1024
-    )
-    container_client = blob_client.get_container_client(azure_storage_container)
-    if not container_client.exists():
-        container_client.create_container()
-    existing_blobs = [blob.name for blob in container_client.list_blobs()]
-
-    # Open each file in /data folder
-    for file in os.scandir("data"):
-        with open(file.path, "rb") as opened_file:
-            filename = os.path.basename(file.path)
-            # Check if blob already exists
-            if filename in existing_blobs:
-                logger.info("Blob already exists, skipping file: %s", filename)
-            else:
-                logger.info("Uploading blob for file: %s", filename)
-                blob_client = container_client.upload_blob(filename, opened_file, overwrite=True)
+        max_single_put_size=4 * 1024 * 1024, max_block_size=4 * 1024 * 1024
+    ) as blob_service_client:
+        container_client = blob_service_client.get_container_client(azure_storage_container)
+        if not await container_client.exists():
+            await container_client.create_container()
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        paths = [file.path for file in os.scandir("data") if file.is_file()]
+        # Let every upload settle before the client closes, then report failures once
+        uploaded = await asyncio.gather(
+            *(_upload_if_changed(container_client, path, semaphore) for path in paths),
+            return_exceptions=True,
+        )
+    failed = [(path, result) for path, result in zip(paths, uploaded) if isinstance(result, BaseException)]
+    if failed:
+        for path, error in failed:
+            logger.error("Uploading %s failed: %s", os.path.basename(path), error)
+        raise RuntimeError(f"{len(failed)} of {len(paths)} uploads failed, not starting the indexer") from failed[0][1]
+
+    if not any(uploaded):
+        logger.info("No blobs changed, not starting the indexer")
+        return False
 
     # Start the indexer
-    try:
-        indexer_client.run_indexer(indexer_name)
-        logger.info("Indexer started. Any unindexed blobs should be indexed in a few minutes, check the Azure Portal for status.")
-    except ResourceExistsError:
-        logger.info("Indexer already running, not starting again")
+    async with SearchIndexerClient(azure_search_endpoint, azure_credential) as indexer_client:
+        try:
+            await indexer_client.run_indexer(indexer_name)
+            logger.info("Indexer started. Any unindexed blobs should be indexed in a few minutes, check the Azure Portal for status.")
+        except ResourceExistsError:
+            logger.info("Indexer already running, not starting again")
+    return True
 
 
 def write_flat_data_to_file():
     # Ensure data directory exists
     if not os.path.exists("data"):
         os.makedirs("data")
-    # Write the FLAT_DATA into a single JSON file
-    with open("data/flat_data.json", "w", encoding="utf-8") as f:
-        json.dump(FLAT_DATA, f, ensure_ascii=False, indent=2)
+    # Write the FLAT_DATA into a single JSON file, one listing at a time, minus near-duplicates
+    detector = NearDuplicateDetector()
+    write_json_array(detector.unique(FLAT_DATA), "data/flat_data.json")
+    if detector.duplicates:
+        logger.info("Dropped %d near-duplicate listings", detector.duplicates)
 
 
 if __name__ == "__main__":
@@ -258,7 +315,8 @@ if __name__ == "__main__":
     AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ["AZURE_OPENAI_ENDPOINT"]
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ["AZURE_OPENAI_EMBEDDING_DEPLOYMENT"]
     AZURE_OPENAI_EMBEDDING_MODEL = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
-    EMBEDDINGS_DIMENSIONS = 3072
+    EMBEDDINGS_DIMENSIONS = int(os.environ.get("AZURE_OPENAI_EMBEDDING_DIMENSIONS", 3072))
+    VECTOR_COMPRESSION = os.environ.get("AZURE_SEARCH_VECTOR_COMPRESSION", "none")
     AZURE_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
     AZURE_STORAGE_ENDPOINT = os.environ["AZURE_STORAGE_ENDPOINT"]
     AZURE_STORAGE_CONNECTION_STRING = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
@@ -276,13 +334,18 @@ if __name__ == "__main__":
         azure_openai_embedding_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
         azure_openai_embedding_deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
         azure_openai_embedding_model=AZURE_OPENAI_EMBEDDING_MODEL,
-        azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS)
-
-    upload_documents(azure_credential,
-        indexer_name=AZURE_SEARCH_INDEX,
-        azure_search_endpoint=AZURE_SEARCH_ENDPOINT,
-        azure_storage_endpoint=AZURE_STORAGE_ENDPOINT,
-        azure_storage_container=AZURE_STORAGE_CONTAINER)
+        azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS,
+        vector_compression=VECTOR_COMPRESSION)
+
+    async def upload_with_async_credential():
+        async with AsyncAzureDeveloperCliCredential(tenant_id=os.environ["AZURE_TENANT_ID"], process_timeout=60) as async_credential:
+            await upload_documents(async_credential,
+                indexer_name=AZURE_SEARCH_INDEX,
+                azure_search_endpoint=AZURE_SEARCH_ENDPOINT,
+                azure_storage_endpoint=AZURE_STORAGE_ENDPOINT,
+                azure_storage_container=AZURE_STORAGE_CONTAINER)
+
+    asyncio.run(upload_with_async_credential())
 
     # Directly upload FLAT_DATA
 
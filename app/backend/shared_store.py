@@ -0,0 +1,260 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("voicerag")
+
+# /dev/shm is RAM-backed, so mapped files there are shared memory without a disk behind them
+SHARED_DATA_DIR = os.getenv(
+    "SHARED_DATA_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "dym-web-app"),
+)
+
+
+@contextmanager
+def _file_lock(path: str):
+    with open(path, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _column_kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return "bool"
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int"
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return "float"
+    return "str"
+
+
+class ListingSnapshot:
+    """One published version of the listing data, memory-mapped read-only.
+
+    Numeric and boolean fields are stored as .npy columns, text fields as a UTF-8
+    blob plus offsets, and the listing embeddings as an (n, dims) float32 matrix.
+    The pages are shared by every process that maps the same version.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = os.path.basename(path)
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.columns: Dict[str, np.ndarray] = {}
+        self._text: Dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for name, kind in self.manifest["columns"].items():
+            if kind == "str":
+                blob_path = os.path.join(path, f"{name}.utf8")
+                blob = (np.memmap(blob_path, dtype=np.uint8, mode="r")
+                        if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8))
+                self._text[name] = (blob, np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r"))
+            else:
+                self.columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        embeddings_path = os.path.join(path, "embeddings.npy")
+        self.embeddings = np.load(embeddings_path, mmap_mode="r") if os.path.exists(embeddings_path) else None
+        self._row_by_id: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def text(self, name: str, row: int) -> str:
+        blob, offsets = self._text[name]
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def listing(self, row: int) -> Dict[str, Any]:
+        doc: Dict[str, Any] = {}
+        for name, kind in self.manifest["columns"].items():
+            if kind == "str":
+                doc[name] = self.text(name, row)
+            elif kind == "float":
+                value = float(self.columns[name][row])
+                doc[name] = None if np.isnan(value) else value
+            else:
+                doc[name] = self.columns[name][row].item()
+        return doc
+
+    def row_of(self, listing_id: str) -> Optional[int]:
+        if self._row_by_id is None:
+            self._row_by_id = {self.text("id", i): i for i in range(len(self))}
+        return self._row_by_id.get(listing_id)
+
+
+class SharedListingStore:
+    """Versioned listing/embedding snapshots published once and mapped by every worker.
+
+    publish() writes a complete new version directory and then atomically swaps the
+    `current` symlink, so readers only ever see whole versions. Workers call
+    snapshot() per request; it remaps only when the pointer has moved. Old versions
+    can be deleted while mapped, since unlinked files stay valid for existing maps.
+    """
+
+    def __init__(self, root: str = SHARED_DATA_DIR, keep_versions: int = 2):
+        self.root = root
+        self.keep_versions = keep_versions
+        os.makedirs(root, exist_ok=True)
+        self._pointer = os.path.join(root, "current")
+        self._snapshot: Optional[ListingSnapshot] = None
+
+    def current_version(self) -> Optional[str]:
+        try:
+            return os.readlink(self._pointer)
+        except FileNotFoundError:
+            return None
+
+    def snapshot(self) -> Optional[ListingSnapshot]:
+        version = self.current_version()
+        if version is None:
+            return None
+        if self._snapshot is None or self._snapshot.version != version:
+            self._snapshot = ListingSnapshot(os.path.join(self.root, version))
+            logger.info("Mapped listing snapshot %s (%d listings)", version, len(self._snapshot))
+        return self._snapshot
+
+    def publish(
+        self,
+        listings: Iterable[Dict[str, Any]],
+        embeddings: Optional[np.ndarray] = None,
+        source: Optional[str] = None,
+    ) -> str:
+        values: Dict[str, List[Any]] = {}
+        count = 0
+        for listing in listings:
+            for name in listing:
+                if name not in values and name != "embedding":
+                    values[name] = [None] * count
+            for name, column in values.items():
+                column.append(listing.get(name))
+            count += 1
+
+        version = f"v{time.time_ns()}"
+        staging = tempfile.mkdtemp(prefix=f".{version}-", dir=self.root)
+        kinds = {}
+        for name, column in values.items():
+            kind = kinds[name] = _column_kind(column)
+            if kind == "str":
+                encoded = [("" if v is None else str(v)).encode("utf-8") for v in column]
+                offsets = np.zeros(count + 1, dtype=np.int64)
+                np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                with open(os.path.join(staging, f"{name}.utf8"), "wb") as f:
+                    f.writelines(encoded)
+                np.save(os.path.join(staging, f"{name}.offsets.npy"), offsets)
+            elif kind == "float":
+                np.save(os.path.join(staging, f"{name}.npy"),
+                        np.array([np.nan if v is None else v for v in column], dtype=np.float64))
+            elif kind == "int":
+                np.save(os.path.join(staging, f"{name}.npy"), np.array([v or 0 for v in column], dtype=np.int64))
+            else:
+                np.save(os.path.join(staging, f"{name}.npy"), np.array([bool(v) for v in column], dtype=np.bool_))
+        if embeddings is not None:
+            np.save(os.path.join(staging, "embeddings.npy"), np.ascontiguousarray(embeddings, dtype=np.float32))
+        with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"count": count, "columns": kinds, "source": source}, f)
+
+        os.rename(staging, os.path.join(self.root, version))
+        tmp_pointer = f"{self._pointer}.{os.getpid()}.tmp"
+        os.symlink(version, tmp_pointer)
+        os.replace(tmp_pointer, self._pointer)
+        logger.info("Published listing snapshot %s (%d listings)", version, count)
+        self._cleanup(version)
+        return version
+
+    def publish_if_missing(
+        self, loader: Callable[[], Iterable[Dict[str, Any]]], source: Optional[str] = None
+    ) -> Optional[ListingSnapshot]:
+        """Publish from loader() unless a snapshot of the same source exists; safe to call from every worker."""
+        with _file_lock(os.path.join(self.root, ".publish.lock")):
+            snapshot = self.snapshot()
+            if snapshot is None or (source is not None and snapshot.manifest.get("source") != source):
+                self.publish(loader(), source=source)
+        return self.snapshot()
+
+    def _cleanup(self, current: str):
+        versions = sorted(d for d in os.listdir(self.root) if d.startswith("v") and d != current)
+        for old in versions[:max(len(versions) - (self.keep_versions - 1), 0)]:
+            shutil.rmtree(os.path.join(self.root, old), ignore_errors=True)
+
+
+class SharedEmbeddingCache:
+    """Fixed-size query-embedding cache in a shared memory-mapped file.
+
+    Direct-mapped slots of (key hash, sequence, vector). Reads are lock-free and use
+    the sequence number as a seqlock to discard slots caught mid-write; writes are
+    serialised across workers with an flock. `namespace` (e.g. the embedder name)
+    keeps vectors from different embedders of the same size apart.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 1024, root: str = SHARED_DATA_DIR, namespace: str = ""):
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self.namespace = namespace
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"query_embeddings_{dimensions}x{capacity}.bin")
+        self._lock_path = self.path + ".lock"
+        self._dtype = np.dtype([("key", "<u8"), ("seq", "<u8"), ("vector", "<f4", (dimensions,))])
+        with _file_lock(self._lock_path):
+            if not os.path.exists(self.path) or os.path.getsize(self.path) != self._dtype.itemsize * capacity:
+                with open(self.path, "wb") as f:
+                    f.truncate(self._dtype.itemsize * capacity)
+        self._slots = np.memmap(self.path, dtype=self._dtype, mode="r+", shape=(capacity,))
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(f"{self.namespace}\0{text}".encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self._key(text)
+        slot = key % self.capacity
+        seq = int(self._slots["seq"][slot])
+        if seq % 2 == 0 and int(self._slots["key"][slot]) == key:
+            vector = np.array(self._slots["vector"][slot])
+            if int(self._slots["seq"][slot]) == seq:
+                self.hits += 1
+                return vector.tolist()
+        self.misses += 1
+        return None
+
+    def put(self, text: str, vector: List[float]):
+        if len(vector) != self.dimensions:
+            return
+        key = self._key(text)
+        slot = key % self.capacity
+        with _file_lock(self._lock_path):
+            self._slots["seq"][slot] += 1
+            self._slots["key"][slot] = 0
+            self._slots["vector"][slot] = vector
+            self._slots["key"][slot] = key
+            self._slots["seq"][slot] += 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Publish a new shared listing snapshot for the running workers.")
+    parser.add_argument("path", help="NDJSON or JSON array file of listings")
+    parser.add_argument("--embeddings", help="Optional .npy matrix of listing embeddings, row-aligned with the file")
+    parser.add_argument("--root", default=SHARED_DATA_DIR)
+    args = parser.parse_args()
+
+    from ingest import iter_listings
+
+    store = SharedListingStore(args.root)
+    matrix = np.load(args.embeddings) if args.embeddings else None
+    print("Published", store.publish(iter_listings(args.path), embeddings=matrix))
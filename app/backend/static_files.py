@@ -0,0 +1,188 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only precompressed .br files are served
+    brotli = None
+
+logger = logging.getLogger("voicerag")
+
+# Vite emits content-hashed names such as assets/index-BrCwpeIS.js; requiring a character outside
+# a-z keeps plain names like audio-playback.js from being cached as immutable
+_HASHED_ASSET = re.compile(r"^assets/.+-(?=[^.]*[A-Z0-9_])[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+_COMPRESSIBLE_SUFFIXES = {".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".ico", ".xml", ".wasm"}
+_MIN_COMPRESS_SIZE = 1024
+_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class _Variant:
+    body: bytes
+    etag: str
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+
+
+def _compress(data: bytes, encoding: str) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def _accepted_encodings(request: web.Request) -> list[str]:
+    accepted = []
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.append(name.strip().lower())
+    # Prefer brotli, it's typically 15-20% smaller than gzip for JS/CSS
+    return [e for e in ("br", "gzip") if e in accepted]
+
+
+def etag_matches(request: web.Request, etag: str) -> bool:
+    """Whether If-None-Match lists etag (weak or strong) or is *."""
+    candidates = request.headers.get("If-None-Match")
+    if not candidates:
+        return False
+    return any(c.strip().removeprefix("W/") in (etag, "*") for c in candidates.split(","))
+
+
+class StaticFiles:
+    """Serves the built frontend with compression negotiation and cache validators.
+
+    Precompressed .br/.gz siblings produced at build time are used when present;
+    otherwise compressible files are compressed on first request and the result is
+    kept in memory. Content-hashed assets are marked immutable, everything else
+    (including index.html) must revalidate via a strong ETag.
+    """
+
+    def __init__(self, root: Path, max_cache_bytes: int = 64 * 1024 * 1024):
+        self.root = root.resolve()
+        self.max_cache_bytes = max_cache_bytes
+        # None entries remember that a file has no worthwhile compressed variant
+        self._cache: Dict[tuple[Path, str], Optional[_Variant]] = {}
+        self._cache_bytes = 0
+
+    def _resolve(self, rel_path: str) -> Optional[Path]:
+        path = (self.root / rel_path.lstrip("/")).resolve()
+        if not path.is_relative_to(self.root) or not path.is_file():
+            return None
+        return path
+
+    async def _variant(self, path: Path, encoding: str) -> Optional[_Variant]:
+        key = (path, encoding)
+        if key in self._cache:
+            return self._cache[key]
+
+        # Reading and brotli at quality 11 would stall every websocket on this worker
+        variant = await asyncio.to_thread(self._build_variant, path, encoding)
+        if key in self._cache:
+            # Another request built it meanwhile
+            return self._cache[key]
+        if variant is None:
+            self._cache[key] = None
+        elif self._cache_bytes + len(variant.body) <= self.max_cache_bytes:
+            self._cache[key] = variant
+            self._cache_bytes += len(variant.body)
+        return variant
+
+    @staticmethod
+    def _build_variant(path: Path, encoding: str) -> Optional[_Variant]:
+        data = path.read_bytes()
+        etag_base = hashlib.sha256(data).hexdigest()[:32]
+        if encoding == "identity":
+            variant = _Variant(data, f'"{etag_base}"')
+        else:
+            if path.suffix not in _COMPRESSIBLE_SUFFIXES or len(data) < _MIN_COMPRESS_SIZE:
+                return None
+            precompressed = path.with_name(path.name + _ENCODING_SUFFIXES[encoding])
+            if precompressed.is_file() and precompressed.stat().st_mtime >= path.stat().st_mtime:
+                body = precompressed.read_bytes()
+            else:
+                body = _compress(data, encoding)
+            if body is None or len(body) >= len(data):
+                return None
+            variant = _Variant(body, f'"{etag_base}-{encoding}"')
+        return variant
+
+    async def _respond(self, request: web.Request, path: Path) -> web.StreamResponse:
+        encoding = "identity"
+        variant = None
+        for candidate in _accepted_encodings(request):
+            variant = await self._variant(path, candidate)
+            if variant is not None:
+                encoding = candidate
+                break
+        if variant is None:
+            variant = await self._variant(path, "identity")
+
+        rel_name = path.relative_to(self.root).as_posix()
+        headers = {
+            "ETag": variant.etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if _HASHED_ASSET.match(rel_name) else REVALIDATE_CACHE_CONTROL,
+        }
+        if etag_matches(request, variant.etag):
+            return web.Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        content_type, _ = mimetypes.guess_type(path.name)
+        # For HEAD, aiohttp sends the Content-Length of the body but not the body itself
+        return web.Response(body=variant.body, headers=headers, content_type=content_type or "application/octet-stream")
+
+    async def _index_handler(self, request: web.Request) -> web.StreamResponse:
+        return await self._respond(request, self.root / "index.html")
+
+    async def _file_handler(self, request: web.Request) -> web.StreamResponse:
+        path = self._resolve(request.match_info["path"])
+        if path is None:
+            raise web.HTTPNotFound()
+        return await self._respond(request, path)
+
+    def attach_to_app(self, app: web.Application):
+        # Register last: the catch-all route would otherwise shadow later GET routes
+        app.router.add_get("/", self._index_handler)
+        app.router.add_get("/{path:.+}", self._file_handler, name="static")
+
+
+def precompress(root: Path) -> int:
+    """Write .br/.gz siblings for compressible files under root; returns bytes saved for gzip."""
+    saved = 0
+    for path in root.rglob("*"):
+        if not path.is_file() or path.suffix not in _COMPRESSIBLE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        if len(data) < _MIN_COMPRESS_SIZE:
+            continue
+        for encoding, suffix in _ENCODING_SUFFIXES.items():
+            body = _compress(data, encoding)
+            if body is not None and len(body) < len(data):
+                path.with_name(path.name + suffix).write_bytes(body)
+                if encoding == "gzip":
+                    saved += len(data) - len(body)
+        logger.info("Precompressed %s", path.relative_to(root))
+    return saved
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    static_root = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "static"
+    print(f"Precompressed {static_root}, gzip saves {precompress(static_root) / 1024:.0f} KiB")
@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from resilience import LatencyTracker
+from shared_store import SHARED_DATA_DIR, ListingSnapshot, SharedListingStore
+
+
+class ToolExecutionMode(Enum):
+    # Async target awaited directly on the event loop; for I/O-bound tools
+    INLINE = 1
+    # Sync target run on a bounded thread pool; for blocking SDK calls
+    THREAD = 2
+    # Sync, picklable (module-level) target run in a process pool; for CPU-heavy tools
+    PROCESS = 3
+
+
+_worker_store: Optional[SharedListingStore] = None
+
+
+def _init_process_worker(shared_data_dir: str):
+    global _worker_store
+    _worker_store = SharedListingStore(shared_data_dir)
+    # Map the current snapshot up-front so the first tool call doesn't pay for it
+    _worker_store.snapshot()
+
+
+def worker_listing_snapshot() -> Optional[ListingSnapshot]:
+    """The shared listing snapshot, for PROCESS-mode tool targets running in a pool worker."""
+    return _worker_store.snapshot() if _worker_store is not None else None
+
+
+def _timed_call(target: Callable[[Any], Any], args: Any) -> tuple[Any, float]:
+    # Wall-clock start, comparable with the submit time in the parent process
+    started = time.time()
+    return target(args), started
+
+
+class _Pool:
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int, max_queued: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        # Bounds the work waiting in the executor's internal (unbounded) queue
+        self._slots = asyncio.Semaphore(max_workers + max_queued)
+        self.queue_time = LatencyTracker(window=500, min_samples=1)
+        self.submitted = 0
+        self.completed = 0
+        self.in_flight = 0
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, target: Callable[[Any], Any], args: Any) -> Any:
+        if self._executor is None:
+            self._executor = self._factory()
+        submitted_at = time.time()
+        self.submitted += 1
+        loop = asyncio.get_running_loop()
+        await self._slots.acquire()
+        self.in_flight += 1
+        try:
+            future = self._executor.submit(_timed_call, target, args)
+        except BaseException:
+            self._release()
+            raise
+
+        def done(_):
+            # A cancelled caller (e.g. a missed deadline) can't stop a running worker, so the
+            # slot is only freed once the work itself is done; this keeps the pool bounded
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(self._release)
+
+        future.add_done_callback(done)
+        # Cancelling the caller still cancels the work if it hasn't started yet
+        result, started_at = await asyncio.wrap_future(future)
+        self.completed += 1
+        self.queue_time.observe(max(started_at - submitted_at, 0.0))
+        return result
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "max_workers": self.max_workers,
+            "started": self._executor is not None,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "in_flight": self.in_flight,
+            "queue_ms_p50": ms(self.queue_time.percentile(0.5)),
+            "queue_ms_p95": ms(self.queue_time.percentile(0.95)),
+            "queue_ms_max": ms(self.queue_time.percentile(1.0)),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ToolExecutors:
+    """Dispatches tool targets according to their ToolExecutionMode.
+
+    Pools are created on first use, so a worker that only has inline tools never
+    starts threads or child processes.
+    """
+
+    def __init__(
+        self,
+        thread_workers: int = int(os.getenv("TOOL_THREAD_WORKERS", 8)),
+        process_workers: int = int(os.getenv("TOOL_PROCESS_WORKERS", 2)),
+        max_queued: int = 32,
+        shared_data_dir: str = SHARED_DATA_DIR,
+    ):
+        self.threads = _Pool(
+            "thread",
+            lambda: ThreadPoolExecutor(max_workers=thread_workers, thread_name_prefix="tool"),
+            thread_workers, max_queued,
+        )
+        self.processes = _Pool(
+            "process",
+            lambda: ProcessPoolExecutor(
+                max_workers=process_workers, initializer=_init_process_worker, initargs=(shared_data_dir,)
+            ),
+            process_workers, max_queued,
+        )
+
+    def run(self, mode: ToolExecutionMode, target: Callable[[Any], Any], args: Any) -> Awaitable[Any]:
+        if mode == ToolExecutionMode.THREAD:
+            return self.threads.run(target, args)
+        if mode == ToolExecutionMode.PROCESS:
+            return self.processes.run(target, args)
+        return target(args)
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {"thread": self.threads.metrics, "process": self.processes.metrics}
+
+    def shutdown(self):
+        self.threads.shutdown()
+        self.processes.shutdown()
@@ -0,0 +1,186 @@
+import argparse
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+# text-embedding-3-large is trained so that truncated (and re-normalised) vectors stay
+# useful; the embeddings API returns them directly via the `dimensions` parameter.
+EMBEDDING_DIMENSIONS = int(os.getenv("AZURE_OPENAI_EMBEDDING_DIMENSIONS", 3072))
+# none | scalar | binary
+VECTOR_COMPRESSION = os.getenv("AZURE_SEARCH_VECTOR_COMPRESSION", "none").lower()
+VECTOR_OVERSAMPLING = float(os.getenv("AZURE_SEARCH_VECTOR_OVERSAMPLING", 4.0))
+
+COMPRESSION_MODES = ("none", "scalar", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def compression_configuration(
+    mode: str, name: str, oversampling: float = VECTOR_OVERSAMPLING
+) -> Optional["VectorSearchCompressionConfiguration"]:
+    """Azure AI Search compression config for the index's VectorSearch, or None for full float32."""
+    # Index-management models are only needed when building an index, not by the web app
+    from azure.search.documents.indexes.models import (
+        ScalarQuantizationCompressionConfiguration,
+        ScalarQuantizationParameters,
+        VectorSearchCompressionConfiguration,
+    )
+
+    if mode == "scalar":
+        return ScalarQuantizationCompressionConfiguration(
+            name=name,
+            rerank_with_original_vectors=True,
+            default_oversampling=oversampling,
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8"),
+        )
+    if mode == "binary":
+        # The pinned SDK has no BinaryQuantizationCompression model yet; the base
+        # configuration serialises the same payload once the discriminator is set.
+        config = VectorSearchCompressionConfiguration(
+            name=name, rerank_with_original_vectors=True, default_oversampling=oversampling
+        )
+        config.kind = "binaryQuantization"
+        return config
+    if mode != "none":
+        raise ValueError(f"Unknown vector compression mode '{mode}', expected one of {COMPRESSION_MODES}")
+    return None
+
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Truncate and re-normalise embeddings, matching what the API returns for `dimensions`."""
+    reduced = np.ascontiguousarray(vectors[..., :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+    return reduced / np.maximum(norms, 1e-12)
+
+
+class QuantizedVectors:
+    """In-memory vector store with optional int8/binary quantization.
+
+    Candidates are found on the compact representation, over-fetching
+    `oversampling * k` of them, and rescored against the float32 originals when
+    those are kept. Without originals the quantized scores are returned as-is.
+    """
+
+    def __init__(self, vectors: np.ndarray, mode: str = "scalar", keep_originals: bool = True):
+        if mode not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown vector compression mode '{mode}', expected one of {COMPRESSION_MODES}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.mode = mode
+        self.dimensions = vectors.shape[1]
+        self.originals = vectors if keep_originals or mode == "none" else None
+
+        if mode == "scalar":
+            # Per-dimension symmetric scaling; the scale is folded into the query at search time
+            self.scale = np.maximum(np.abs(vectors).max(axis=0), 1e-12) / 127.0
+            self.codes = np.round(vectors / self.scale).astype(np.int8)
+        elif mode == "binary":
+            self.codes = np.packbits(vectors > 0, axis=1)
+        else:
+            self.codes = vectors
+
+    @property
+    def nbytes(self) -> int:
+        total = self.codes.nbytes
+        if self.originals is not None and self.originals is not self.codes:
+            total += self.originals.nbytes
+        return total
+
+    @property
+    def compact_nbytes(self) -> int:
+        return self.codes.nbytes
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        if self.mode == "scalar":
+            # Only the stored side is quantized; the query stays float32
+            return self.codes.astype(np.float32) @ (query * self.scale)
+        if self.mode == "binary":
+            q = np.packbits(query > 0)
+            # Fewer differing bits means more similar, so negate the Hamming distance
+            return -_POPCOUNT[self.codes ^ q].sum(axis=1, dtype=np.int32)
+        return self.codes @ query
+
+    def search(self, query: np.ndarray, k: int = 5, oversampling: float = VECTOR_OVERSAMPLING) -> tuple[np.ndarray, np.ndarray]:
+        """Return (indices, scores) of the k nearest vectors by cosine similarity."""
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        n = self.codes.shape[0]
+        k = min(k, n)
+        scores = self._approximate_scores(query)
+
+        if self.mode == "none" or self.originals is None:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return top, scores[top].astype(np.float32)
+
+        candidates = min(n, max(k, int(k * oversampling)))
+        pool = np.argpartition(-scores, candidates - 1)[:candidates]
+        exact = self.originals[pool] @ query
+        order = np.argsort(-exact)[:k]
+        return pool[order], exact[order]
+
+
+def _recall_at_k(expected: np.ndarray, actual: np.ndarray) -> float:
+    return len(set(expected.tolist()) & set(actual.tolist())) / len(expected)
+
+
+def benchmark(corpus: np.ndarray, queries: np.ndarray, dimensions: list[int], k: int = 5, oversampling: float = VECTOR_OVERSAMPLING):
+    """Compare memory, per-query latency and recall@k against exact full-dimension float32 search."""
+    full = QuantizedVectors(corpus, mode="none")
+    ground_truth = [full.search(q, k)[0] for q in queries]
+
+    print(f"{'dims':>6} {'mode':>7} {'compact MB':>11} {'total MB':>9} {'ms/query':>9} {'recall@' + str(k):>9}")
+    for dims in dimensions:
+        reduced_corpus = reduce_dimensions(corpus, dims)
+        reduced_queries = reduce_dimensions(queries, dims)
+        for mode in COMPRESSION_MODES:
+            store = QuantizedVectors(reduced_corpus, mode=mode)
+            start = time.perf_counter()
+            results = [store.search(q, k, oversampling=oversampling)[0] for q in reduced_queries]
+            latency = (time.perf_counter() - start) / len(reduced_queries) * 1000
+            recall = np.mean([_recall_at_k(gt, r) for gt, r in zip(ground_truth, results)])
+            print(f"{dims:>6} {mode:>7} {store.compact_nbytes / 2**20:>11.2f} {store.nbytes / 2**20:>9.2f} "
+                  f"{latency:>9.3f} {recall:>9.3f}")
+
+
+def _embed_listings(path: str, cache_path: str) -> np.ndarray:
+    if os.path.exists(cache_path):
+        return np.load(cache_path)
+
+    import dotenv
+
+    from embedders import AzureOpenAIEmbedder
+    from ingest import iter_listings
+
+    dotenv.load_dotenv(override=True)
+    embedder = AzureOpenAIEmbedder("text-embedding-3-large", dimensions=3072, max_batch_size=64)
+    texts = [f"{doc.get('title', '')} {doc.get('description', '')}".strip() for doc in iter_listings(path)]
+    embeddings = np.asarray(embedder.embed(texts), dtype=np.float32)
+    np.save(cache_path, embeddings)
+    return embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reduced dimensions and vector quantization on the listing corpus.")
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "flat_data.json"))
+    parser.add_argument("--cache", default="listing_embeddings.npy", help="Where full-dimension listing embeddings are cached")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use N random unit vectors instead of embedding the listing corpus (no network needed)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", default="3072,1536,1024,512,256")
+    parser.add_argument("--oversampling", type=float, default=VECTOR_OVERSAMPLING)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        corpus = rng.standard_normal((args.synthetic, 3072), dtype=np.float32)
+    else:
+        corpus = _embed_listings(args.data, args.cache)
+    # Queries are perturbed corpus vectors, so each has a meaningful neighbourhood
+    picks = rng.integers(0, len(corpus), args.queries)
+    queries = corpus[picks] + 0.5 * np.abs(corpus).mean() * rng.standard_normal((args.queries, corpus.shape[1]), dtype=np.float32)
+
+    print(f"{len(corpus)} vectors, {args.queries} queries, oversampling {args.oversampling}")
+    benchmark(corpus, queries, [int(d) for d in args.dimensions.split(",")], oversampling=args.oversampling)
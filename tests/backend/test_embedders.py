@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy as np
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+
+from embedders import Embedder, EmbedderMismatchError, HashingEmbedder, check_index_embedder
+from index_manager import IndexManager
+from readiness import Readiness
+from search_manager import SearchManager
+
+
+def _index_built_with(embedder: Embedder):
+    manager = IndexManager(
+        service_name="test",
+        api_key="test",
+        embedding_model="text-embedding-3-large",
+        use_int_vectorization=False,
+        embedder=embedder,
+    )
+    return manager.index
+
+
+def test_embedder_is_abstract():
+    with pytest.raises(TypeError):
+        Embedder()
+
+
+def test_hashing_embedder_is_deterministic():
+    texts = ["Sunny flat with balcony", "Altbau near the Naschmarkt", ""]
+    first = HashingEmbedder(64).embed(texts)
+    second = HashingEmbedder(64).embed(texts)
+    assert first == second
+    assert HashingEmbedder(64).embed_one(texts[0]) == first[0]
+
+
+def test_hashing_embedder_dimensions_and_norm():
+    vectors = np.array(HashingEmbedder(128).embed(["two rooms", "three rooms with garden"]))
+    assert vectors.shape == (2, 128)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+
+def test_hashing_embedder_similar_texts_are_closer():
+    a, b, c = np.array(HashingEmbedder(256).embed(["bright flat with balcony", "bright flat with a balcony", "garage"]))
+    assert a @ b > a @ c
+
+
+def test_check_index_embedder_accepts_matching_index():
+    embedder = HashingEmbedder(64)
+    check_index_embedder(_index_built_with(embedder), HashingEmbedder(64))
+
+
+def test_check_index_embedder_rejects_other_dimensions():
+    with pytest.raises(EmbedderMismatchError):
+        check_index_embedder(_index_built_with(HashingEmbedder(64)), HashingEmbedder(32))
+
+
+def test_check_index_embedder_rejects_other_embedder_profile():
+    class OtherEmbedder(HashingEmbedder):
+        def __init__(self, dimensions: int):
+            super().__init__(dimensions)
+            self.name = "other"
+
+    with pytest.raises(EmbedderMismatchError, match="embedder-hashing-64"):
+        check_index_embedder(_index_built_with(HashingEmbedder(64)), OtherEmbedder(64))
+
+
+class _FakeIndexClient:
+    def __init__(self, index):
+        self.index = index
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get_alias(self, name):
+        raise ResourceNotFoundError("no alias")
+
+    async def get_index(self, name):
+        return self.index
+
+
+def test_embedder_mismatch_refuses_vector_search_and_stops_readiness_retries(monkeypatch):
+    search_manager = SearchManager(service_name="test", api_key="test", index_name="listings",
+                                   embedding_model="text-embedding-3-large", embedder=HashingEmbedder(32))
+    monkeypatch.setattr("search_manager.SearchIndexClient", _FakeIndexClient(_index_built_with(HashingEmbedder(64))))
+    readiness = Readiness()
+    readiness.add("embedder", search_manager.warm_up, permanent=(EmbedderMismatchError,))
+
+    async def scenario():
+        await readiness._on_startup(None)
+        await asyncio.wait_for(asyncio.gather(*readiness._tasks), timeout=1.0)
+        with pytest.raises(EmbedderMismatchError):
+            await search_manager.search_by_embedding("two rooms with balcony")
+        await search_manager.search_client.close()
+
+    asyncio.run(scenario())
+    assert not readiness.ready
+    assert "64-dimensional" in readiness._errors["embedder"]
@@ -0,0 +1,50 @@
+import asyncio
+
+from listing_cache import PartitionCache
+
+
+class _Charge:
+    total = 1.0
+    session_token = "token"
+
+
+class _FakeListingService:
+    """Partition reads snapshot the listings, then wait for `release` before returning them."""
+
+    def __init__(self):
+        self.listings = [{"id": "1", "location": "centrum"}]
+        self.reading = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def partition_version(self, location, session_token=None):
+        return (len(self.listings), 0), 0.1
+
+    async def read_flat_listings(self, location):
+        snapshot = list(self.listings)
+        self.reading.set()
+        await self.release.wait()
+        return snapshot, _Charge()
+
+    async def save_flat_listing(self, listing):
+        self.listings.append(listing)
+        return listing, 1.0
+
+
+def test_read_started_before_a_write_is_not_cached_or_shared():
+    async def scenario():
+        service = _FakeListingService()
+        cache = PartitionCache(service)
+        before_write = asyncio.create_task(cache.query_flat_listings("centrum"))
+        await service.reading.wait()
+        await cache.save_flat_listing({"id": "2", "location": "centrum"})
+        after_write = asyncio.create_task(cache.query_flat_listings("centrum"))
+        await asyncio.sleep(0)
+        service.release.set()
+        return await before_write, await after_write, await cache.query_flat_listings("centrum"), cache.metrics
+
+    before_write, after_write, cached, metrics = asyncio.run(scenario())
+    assert [listing["id"] for listing in before_write] == ["1"]
+    assert [listing["id"] for listing in after_write] == ["1", "2"]
+    assert cached == after_write
+    assert metrics["coalesced"] == 0
+    assert metrics["hits"] == 1
@@ -0,0 +1,27 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from listings_api import ListingDetailsCache, ListingsApi
+from search_manager import LISTING_FIELDS
+
+
+class _FakeSearchManager:
+    async def get_listings_by_ids(self, ids):
+        return [{field: listing_id if field == "id" else None for field in LISTING_FIELDS} for listing_id in ids]
+
+
+def test_listings_revalidation_parses_if_none_match():
+    async def scenario():
+        app = web.Application()
+        ListingsApi(_FakeSearchManager(), ListingDetailsCache()).attach_to_app(app, "/api/listings")
+        async with TestClient(TestServer(app)) as client:
+            etag = (await client.get("/api/listings?ids=1")).headers["ETag"]
+            statuses = []
+            for if_none_match in (etag, f'"other", W/{etag}', "*", f'"x{etag[1:-1]}x"', '"other"'):
+                response = await client.get("/api/listings?ids=1", headers={"If-None-Match": if_none_match})
+                statuses.append(response.status)
+            return statuses
+
+    assert asyncio.run(scenario()) == [304, 304, 304, 200, 200]
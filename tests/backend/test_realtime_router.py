@@ -0,0 +1,141 @@
+import asyncio
+import json
+import socket
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from azure.core.credentials import AzureKeyCredential
+
+from realtime_router import RealtimeRouter, RealtimeTarget, parse_realtime_targets
+from rtmt import RTMiddleTier
+
+
+def _mock_realtime(status: int = None):
+    """A stand-in for the realtime API: refuses the handshake with `status`, or accepts and says hello."""
+    async def handler(request: web.Request):
+        handler.connects += 1
+        if status is not None:
+            return web.Response(status=status)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({"type": "session.created", "session": {}}))
+        async for _ in ws:
+            pass
+        return ws
+
+    handler.connects = 0
+    app = web.Application()
+    app.router.add_get("/openai/realtime", handler)
+    return app, handler
+
+
+def _closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _open_session(middle_tier_url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(middle_tier_url) as ws:
+            return await ws.receive_json(timeout=5)
+
+
+def test_parse_realtime_targets():
+    targets = parse_realtime_targets("https://a.example/|rt-a, https://b.example|rt-b|secret")
+    assert [(t.endpoint, t.deployment, t.key) for t in targets] == [
+        ("https://a.example", "rt-a", None),
+        ("https://b.example", "rt-b", "secret"),
+    ]
+    assert parse_realtime_targets(None) == []
+
+
+def test_order_prefers_fast_unthrottled_targets():
+    fast, slow, throttled = RealtimeTarget("http://fast", "d"), RealtimeTarget("http://slow", "d"), RealtimeTarget("http://throttled", "d")
+    router = RealtimeRouter([slow, throttled, fast], throttle_penalty=2.0)
+    router.record_connect(fast, 0.05)
+    router.record_connect(slow, 0.5)
+    router.record_connect(throttled, 0.01)
+    router.record_throttled(throttled)
+    assert router.order() == [fast, slow, throttled]
+
+    router.record_failure(fast)
+    assert router.order()[-1] is fast
+    assert router.metrics["targets"]["http://fast|d"]["cooling_down"]
+
+
+def test_failover_across_mock_realtime_servers():
+    async def scenario():
+        throttling_app, throttling_handler = _mock_realtime(status=429)
+        healthy_app, healthy_handler = _mock_realtime()
+        throttling, healthy = TestServer(throttling_app), TestServer(healthy_app)
+        await throttling.start_server()
+        await healthy.start_server()
+        refused_url = f"http://127.0.0.1:{_closed_port()}"
+
+        targets = [
+            RealtimeTarget(str(throttling.make_url("")), "throttling"),
+            RealtimeTarget(refused_url, "refused"),
+            RealtimeTarget(str(healthy.make_url("")), "healthy"),
+        ]
+        middle_tier = RTMiddleTier(targets[0].endpoint, "throttling", AzureKeyCredential("test"), targets=targets)
+        middle_tier.connect_timeout = 2.0
+        app = web.Application()
+        middle_tier.attach_to_app(app, "/realtime")
+        front = TestServer(app)
+        await front.start_server()
+        try:
+            # Untried targets rank in configuration order: 429, then refused, then the healthy one
+            first = await _open_session(str(front.make_url("/realtime")))
+            metrics = middle_tier.router.metrics
+            # Now the healthy target ranks first and is used directly
+            second = await _open_session(str(front.make_url("/realtime")))
+            return first, second, metrics, middle_tier.router.metrics, throttling_handler.connects, healthy_handler.connects
+        finally:
+            await front.close()
+            await throttling.close()
+            await healthy.close()
+
+    first, second, after_first, after_second, throttled_connects, healthy_connects = asyncio.run(scenario())
+    assert first["type"] == second["type"] == "session.created"
+
+    assert after_first["failovers"] == 2
+    by_deployment = {name.rsplit("|", 1)[1]: state for name, state in after_first["targets"].items()}
+    assert by_deployment["throttling"]["throttles"] == 1
+    assert by_deployment["throttling"]["recent_throttles"] == 1
+    assert not by_deployment["throttling"]["cooling_down"]
+    assert by_deployment["refused"]["failures"] == 1
+    assert by_deployment["refused"]["cooling_down"]
+    assert by_deployment["healthy"]["connects"] == 1
+    assert by_deployment["healthy"]["connect_seconds"] is not None
+    assert after_first["preferred"].endswith("|healthy")
+    assert by_deployment["refused"]["rank"] == 2
+
+    # The second session went straight to the healthy target
+    assert after_second["failovers"] == 2
+    assert throttled_connects == 1
+    assert healthy_connects == 2
+
+
+def test_all_targets_failing_reports_upstream_unavailable():
+    async def scenario():
+        throttling = TestServer(_mock_realtime(status=429)[0])
+        await throttling.start_server()
+        targets = [RealtimeTarget(str(throttling.make_url("")), "throttling"),
+                   RealtimeTarget(f"http://127.0.0.1:{_closed_port()}", "refused")]
+        middle_tier = RTMiddleTier(targets[0].endpoint, "throttling", AzureKeyCredential("test"), targets=targets)
+        app = web.Application()
+        middle_tier.attach_to_app(app, "/realtime")
+        front = TestServer(app)
+        await front.start_server()
+        try:
+            return await _open_session(str(front.make_url("/realtime"))), middle_tier.router.metrics
+        finally:
+            await front.close()
+            await throttling.close()
+
+    message, metrics = asyncio.run(scenario())
+    assert message["type"] == "error"
+    assert message["error"]["code"] == "upstream_unavailable"
+    assert metrics["failovers"] == 1
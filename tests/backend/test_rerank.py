@@ -0,0 +1,13 @@
+import warnings
+
+from rerank import RerankWeights, preference_scores, rerank
+
+
+def test_candidates_without_search_scores_are_ranked_by_preferences():
+    candidates = [{"id": "1", "price": 1200}, {"id": "2", "price": 700}, {"id": "3", "price": 950}]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        scores = preference_scores(candidates, {"budget": {"max": 800}}, RerankWeights())
+        ranked = rerank(candidates, {"budget": {"max": 800}}, k=3)
+    assert not any(score != score for score in scores)
+    assert [c["id"] for c in ranked] == ["2", "3", "1"]
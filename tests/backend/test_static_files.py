@@ -0,0 +1,42 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from static_files import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, StaticFiles
+
+
+def _request_all(root, requests):
+    async def scenario():
+        app = web.Application()
+        StaticFiles(root).attach_to_app(app)
+        async with TestClient(TestServer(app)) as client:
+            responses = []
+            for method, path in requests:
+                response = await client.request(method, path, headers={"Accept-Encoding": "gzip"}, auto_decompress=False)
+                responses.append((response.status, response.headers, await response.read()))
+            return responses
+
+    return asyncio.run(scenario())
+
+
+def test_head_sends_headers_without_body(tmp_path):
+    (tmp_path / "index.html").write_text("<html>" + "x" * 2000)
+    (head_status, head_headers, head_body), (get_status, get_headers, get_body) = _request_all(
+        tmp_path, [("HEAD", "/"), ("GET", "/")])
+    assert head_status == get_status == 200
+    assert head_body == b""
+    assert head_headers["Content-Encoding"] == get_headers["Content-Encoding"] == "gzip"
+    assert int(head_headers["Content-Length"]) == len(get_body)
+    assert head_headers["ETag"] == get_headers["ETag"]
+
+
+def test_only_hashed_assets_are_immutable(tmp_path):
+    (tmp_path / "assets").mkdir()
+    for name in ("index-BrCwpeIS.js", "audio-playback.js", "logo-inverted.svg"):
+        (tmp_path / "assets" / name).write_text("x")
+    (tmp_path / "index-BrCwpeIS.js").write_text("x")
+    responses = _request_all(tmp_path, [("GET", "/assets/index-BrCwpeIS.js"), ("GET", "/assets/audio-playback.js"),
+                                        ("GET", "/assets/logo-inverted.svg"), ("GET", "/index-BrCwpeIS.js")])
+    assert [headers["Cache-Control"] for _, headers, _ in responses] == [
+        IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL]
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from tool_executors import ToolExecutionMode, ToolExecutors
+
+
+def _sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def test_idle_pool_reports_queue_time_without_execution_time():
+    async def scenario():
+        executors = ToolExecutors(thread_workers=2, process_workers=1)
+        try:
+            assert await executors.run(ToolExecutionMode.THREAD, _sleep, 0.5) == 0.5
+            return executors.metrics["thread"]
+        finally:
+            executors.shutdown()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["completed"] == 1
+    assert metrics["in_flight"] == 0
+    assert metrics["queue_ms_p50"] < 100
+
+
+def test_queue_time_counts_waiting_for_a_busy_worker():
+    async def scenario():
+        executors = ToolExecutors(thread_workers=1, process_workers=1)
+        try:
+            await asyncio.gather(*(executors.run(ToolExecutionMode.THREAD, _sleep, 0.2) for _ in range(2)))
+            return executors.metrics["thread"]
+        finally:
+            executors.shutdown()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["queue_ms_max"] >= 150